@@ -0,0 +1,91 @@
+"""Watches config.yaml and applies changes to it while running."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from typing import Callable
+
+from ruamel.yaml import YAML
+from ruamel.yaml.error import YAMLError
+
+import log_tailer
+
+
+class ConfigReloader:
+    """
+    Reloads the config file whenever it is saved, and hands the new config to `on_reload`.
+
+    `on_reload` should validate everything before applying anything, and raise ValueError if the new config is invalid.
+    The previous config then stays in effect and the error is logged. Any other exception from `on_reload` is logged
+    with its traceback and handled the same way, so a bad edit never takes the running session down.
+
+    Parameters
+    ----------
+    path : str
+        Path of the config file.
+    on_reload : Callable[[dict], None]
+        Validates and applies a reloaded config.
+    settle_time : float
+        How long the file must be quiet before it is read, so a save written in several steps is read whole.
+    logger : Logger
+        Logger to report reloads and errors to.
+    """
+
+    def __init__(self, path: str, on_reload: Callable[[dict], None], settle_time: float = 0.02, logger=logging):
+        self.path = path
+        self.on_reload = on_reload
+        self.settle_time = settle_time
+        self.logger = logger
+        self._yaml = YAML(typ="safe")
+        self._digest = self._read_digest()
+
+    def _read_digest(self) -> bytes | None:
+        try:
+            with open(self.path, mode="rb") as f:
+                return hashlib.sha1(f.read()).digest()
+        except OSError:
+            return None
+
+    def reload(self) -> bool:
+        """Reload the config if its contents changed, returning whether the new config was applied."""
+        try:
+            with open(self.path, mode="rb") as f:
+                data = f.read()
+        except OSError as e:
+            self.logger.warning(f"Could not read {self.path}: {e!r}")
+            return False
+        digest = hashlib.sha1(data).digest()
+        if digest == self._digest:
+            # e.g. only touched, or saved without changes
+            return False
+        self._digest = digest
+        try:
+            config = self._yaml.load(data)
+            if not isinstance(config, dict):
+                raise ValueError("the file is not a mapping of settings")
+            self.on_reload(config)
+        except (YAMLError, ValueError, KeyError, TypeError) as e:
+            self.logger.error(f"Not applying {self.path}, keeping the previous settings: {e}")
+            return False
+        except Exception:  # pylint: disable=broad-except
+            # a shape of config the validation doesn't know about yet, still never worth ending the session over
+            self.logger.exception(f"Not applying {self.path}, keeping the previous settings")
+            return False
+        self.logger.info(f"Applied changes to {self.path}")
+        return True
+
+    async def run(self) -> None:
+        """Reload on every change to the file, until cancelled."""
+        watcher = log_tailer.LogWatcher(self.path, min_poll_interval=0.05, max_poll_interval=0.5)
+        try:
+            while True:
+                await watcher.wait()
+                # let the save finish
+                while await watcher.wait(timeout=self.settle_time):
+                    pass
+                self.reload()
+        finally:
+            watcher.close()
@@ -0,0 +1,242 @@
+"""
+Debug recording of uber bar frames: a fixed-size ring file written by a background thread, exported to PNG on demand.
+
+Usage: python debug_recorder.py <ring file> [--last N] [--state building|full|draining|hidden] [--out dir] [--list]
+"""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# file header: magic, format version, frame height, width and channels, number of slots, padded to 64 bytes
+_HEADER = struct.Struct("<8sIIIII36x")
+MAGIC = b"TFFRAMES"
+VERSION = 1
+
+# bar state per frame, index stored in each slot
+STATES = ("hidden", "building", "full", "draining")
+_STATE_INDEX = {state: index for index, state in enumerate(STATES)}
+
+
+def slot_dtype(shape: tuple[int, int, int]) -> np.dtype:
+    """
+    The dtype of one ring slot holding a frame of `shape` (height, width, channels).
+
+    `sequence` counts frames from 1, so 0 marks a slot that was never written. `time` is seconds since the epoch and
+    `percentage` is the analysed fill (NaN while the bar is hidden).
+    """
+    return np.dtype(
+        [
+            ("sequence", "<u8"),
+            ("time", "<f8"),
+            ("percentage", "<f4"),
+            ("state", "u1"),
+            ("_pad", "u1", (3,)),
+            ("frame", "u1", shape),
+        ]
+    )
+
+
+class FrameRecorder:
+    """
+    Records uber bar frames with their analysis into a preallocated ring file.
+
+    `record()` only puts the frame on a bounded queue; a background thread copies it into the next slot of a
+    memory-mapped ring file, whose size is fixed by `max_bytes` so debug mode can run indefinitely. The file is
+    created (overwriting the last session's) when the first frame arrives, as the frame size is only known then. If
+    the writer falls behind, frames are dropped rather than slowing down the loop.
+
+    Parameters
+    ----------
+    path : str | Path
+        The ring file.
+    max_bytes : int
+        Size cap of the ring file. It holds as many frames as fit.
+    queue_size : int
+        How many frames may wait for the writer before new ones are dropped.
+    logger : Logger
+        Logger to report problems to.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 64 * 1024 * 1024, queue_size: int = 64, logger=logging):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.recorded = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._ring: Optional[np.memmap] = None
+        self._thread = threading.Thread(target=self._run, name="debug-frames", daemon=True)
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        self._thread.start()
+
+    def record(self, frame: np.ndarray, captured_at: float, percentage: Optional[float], state: Optional[str]) -> None:
+        """
+        Queue a frame for recording.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The captured frame, shape (height, width, channels), uint8.
+        captured_at : float
+            When it was captured (time.monotonic()).
+        percentage : Optional[float]
+            The analysed uber percentage, None if the bar was not visible.
+        state : Optional[str]
+            The analysed bar state, None if the bar was not visible.
+        """
+        wall_time = time.time() - (time.monotonic() - captured_at)
+        try:
+            # the capture worker reuses its frame buffers, so the writer gets its own copy
+            self._queue.put_nowait((frame.copy(), wall_time, percentage, state))
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self, shape: tuple[int, int, int]) -> np.memmap:
+        dtype = slot_dtype(shape)
+        capacity = max(1, (self.max_bytes - _HEADER.size) // dtype.itemsize)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, mode="wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, *shape, capacity))
+            # sized up front (sparse where supported), so the ring never grows
+            f.truncate(_HEADER.size + capacity * dtype.itemsize)
+        self.logger.info(f"Recording up to {capacity} uber bar frames to {self.path}")
+        return np.memmap(self.path, dtype=dtype, mode="r+", offset=_HEADER.size, shape=(capacity,))
+
+    def _run(self) -> None:
+        sequence = 0
+        while (item := self._queue.get()) is not None:
+            frame, wall_time, percentage, state = item
+            if frame.ndim == 2:
+                frame = frame[:, :, np.newaxis]
+            try:
+                if self._ring is None:
+                    self._ring = self._open(frame.shape)
+                elif frame.shape != self._ring.dtype["frame"].shape:
+                    self.dropped += 1
+                    continue
+                ring, index = self._ring, sequence % len(self._ring)
+                # once the ring wraps the slot still holds an older frame; mark it unwritten while it is overwritten
+                # and set the new sequence number last, so a reader never takes a mix of two frames for one
+                ring["sequence"][index] = 0
+                ring["frame"][index] = frame
+                ring["time"][index] = wall_time
+                ring["percentage"][index] = np.nan if percentage is None else percentage
+                ring["state"][index] = _STATE_INDEX.get(state, 0)
+                sequence += 1
+                ring["sequence"][index] = sequence
+                self.recorded += 1
+            except OSError as e:
+                self.logger.warning(f"Could not write debug frames to {self.path}: {e!r}")
+                self.dropped += 1
+
+    def close(self) -> None:
+        """Write the queued frames and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        if self._ring is not None:
+            self._ring.flush()
+            self._ring = None
+        if self.dropped:
+            self.logger.info(f"Recorded {self.recorded} debug frames, dropped {self.dropped}")
+
+
+def load_ring(path: str | Path) -> np.ndarray:
+    """
+    Read the written slots of a ring file, oldest first.
+
+    Parameters
+    ----------
+    path : str | Path
+        The ring file.
+
+    Returns
+    -------
+    np.ndarray
+        The slots (see `slot_dtype`), in recording order.
+    """
+    with open(path, mode="rb") as f:
+        magic, version, height, width, channels, capacity = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} debug frame file")
+    dtype = slot_dtype((height, width, channels))
+    ring = np.memmap(path, dtype=dtype, mode="r", offset=_HEADER.size, shape=(capacity,))
+    written = np.flatnonzero(ring["sequence"])
+    order = written[np.argsort(ring["sequence"][written])]
+    slots = np.array(ring[order])
+    # during a session the recorder may have started overwriting a slot while it was copied, which changes its
+    # sequence number (see FrameRecorder._run), so only slots that still have the number they were copied with are whole
+    return slots[ring["sequence"][order] == slots["sequence"]]
+
+
+def export_png(slots: np.ndarray, out_dir: str | Path) -> list[Path]:
+    """
+    Write frames to PNG files named after their time, sequence number, state and percentage.
+
+    Parameters
+    ----------
+    slots : np.ndarray
+        The slots to export, e.g. a selection from `load_ring`.
+    out_dir : str | Path
+        The directory to write to.
+
+    Returns
+    -------
+    list[Path]
+        The written files.
+    """
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for slot in slots:
+        milliseconds = int(slot["time"] * 1000) % 1000
+        stamp = f"{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(slot['time']))}.{milliseconds:03d}"
+        percentage = "" if np.isnan(slot["percentage"]) else f"_{slot['percentage']:.1f}"
+        path = out_dir / f"uber_bar_{stamp}_{slot['sequence']}_{STATES[slot['state']]}{percentage}.png"
+        frame = slot["frame"]
+        Image.fromarray(frame[:, :, 0] if frame.shape[2] == 1 else frame).save(path)
+        written.append(path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or export the uber bar frames recorded in debug mode.")
+    parser.add_argument("ring", help="the ring file, uber_frames.ring in debug_save_dir")
+    parser.add_argument("--last", type=int, help="only the last N frames")
+    parser.add_argument("--state", choices=STATES, help="only frames with this bar state")
+    parser.add_argument("--out", default=".", help="directory to export PNGs to")
+    parser.add_argument("--list", action="store_true", help="list the frames instead of exporting them")
+    args = parser.parse_args()
+
+    selected = load_ring(args.ring)
+    if args.state is not None:
+        selected = selected[selected["state"] == STATES.index(args.state)]
+    if args.last is not None:
+        selected = selected[-args.last :]
+
+    if args.list:
+        for record in selected:
+            print(
+                f"{record['sequence']:>8} {time.strftime('%H:%M:%S', time.localtime(record['time']))} "
+                f"{STATES[record['state']]:<9} {record['percentage']:.1f}%"
+            )
+    else:
+        paths = export_png(selected, args.out)
+        print(f"Exported {len(paths)} frames to {os.path.abspath(args.out)}")
@@ -0,0 +1,115 @@
+"""Applies parsed console.log events to the player state and the vibration handler."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+from typing import Iterable, Optional
+
+import log_parser
+from journal import JournalWriter
+from latency import LatencyRecorder
+from vibration_handler import VibrationHandler
+
+
+class EventProcessor:
+    """
+    Tracks the local player's class and weapon slot and triggers vibes for kills and deaths.
+
+    Parameters
+    ----------
+    logger : Logger
+        Logger to report events to.
+    classifier : log_parser.LineClassifier
+        Classifier set up with the local player's name.
+    vibe : VibrationHandler
+        The vibration handler to trigger.
+    latency : Optional[LatencyRecorder]
+        Records how long lines take to be parsed and applied, if given.
+    journal : Optional[JournalWriter]
+        Records the events in the session journal, if given.
+    """
+
+    def __init__(
+        self,
+        logger,
+        classifier: log_parser.LineClassifier,
+        vibe: VibrationHandler,
+        latency: Optional[LatencyRecorder] = None,
+        journal: Optional[JournalWriter] = None,
+    ):
+        self.logger = logger
+        self.classifier = classifier
+        self.vibe = vibe
+        self.latency = latency
+        self.journal = journal
+        self.curr_class: Optional[log_parser.PlayerClass] = None
+        self.curr_weapon = -1
+
+    @property
+    def uber_bar_visible(self) -> bool:
+        """Whether the medic uber bar should be on screen (medigun or melee out)."""
+        return self.curr_class is log_parser.PlayerClass.MEDIC and self.curr_weapon in (2, 3)
+
+    def handle_line(self, line: bytes | str, detected_at: Optional[float] = None) -> Optional[log_parser.LogEvent]:
+        """
+        Classify a console.log line and apply the resulting event.
+
+        Parameters
+        ----------
+        line : bytes | str
+            The raw log line.
+        detected_at : Optional[float]
+            When the line was noticed in console.log (LatencyRecorder.now()), for latency instrumentation.
+
+        Returns
+        -------
+        Optional[log_parser.LogEvent]
+            The event the line was classified as, or None.
+        """
+        event = self.classifier.classify(line)
+        if event is None:
+            return None
+        traced = self.latency is not None and detected_at is not None
+        parsed_at = None
+        if traced:
+            parsed_at = self.latency.since("detect_to_parse", detected_at)
+
+        if isinstance(event, log_parser.ClassSwitch):
+            self.curr_class = event.player_class
+            self.logger.info(f"New class: {self.curr_class.value}")
+            self.vibe.killstreak = 0
+            self.vibe.uberstreak = 0
+            if self.journal is not None:
+                self.journal.class_switch(event.player_class)
+
+        elif isinstance(event, log_parser.SlotSwitch):
+            self.curr_weapon = event.slot
+            if self.journal is not None:
+                self.journal.slot_switch(event.slot)
+
+        elif isinstance(event, log_parser.KillEvent):
+            player_class = self.curr_class.value if self.curr_class is not None else None
+            if event.by_player:  # we got a kill
+                print(f"Kill logged, streak: {self.vibe.killstreak}{', crit' if event.crit else ''}")
+                self.vibe.kill(event.crit, player_class, event.weapon)
+                if self.journal is not None:
+                    self.journal.kill(event.crit)
+            if event.of_player:  # we died :(
+                self.logger.info("Death logged")
+                self.vibe.death(player_class, event.weapon)
+                if self.journal is not None:
+                    self.journal.death()
+            if traced and (event.by_player or event.of_player):
+                self.latency.trace_applied(detected_at, parsed_at, [self.vibe])
+
+        return event
+
+    def catch_up(self, lines: Iterable[bytes]) -> None:
+        """Apply only the class / weapon switches from `lines`, e.g. ones written while we weren't running."""
+        for line in lines:
+            event = self.classifier.classify(line)
+            if isinstance(event, log_parser.ClassSwitch):
+                self.curr_class = event.player_class
+            elif isinstance(event, log_parser.SlotSwitch):
+                self.curr_weapon = event.slot
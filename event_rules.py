@@ -0,0 +1,120 @@
+"""Per event, class and weapon vibe rules from config.yaml, compiled once into a flat lookup table."""
+
+from __future__ import annotations
+
+import math
+from typing import NamedTuple, Optional
+
+import log_parser
+
+EVENTS = ("kill", "death")
+_CLASSES = tuple(player_class.value for player_class in log_parser.PlayerClass)
+_RULE_KEYS = frozenset(("event", "class", "weapon", "strength", "time", "envelope"))
+# largest value of each numeric rule field, None for no limit; all of them are at least 0
+_RULE_MAXIMUMS: dict[str, Optional[float]] = {"strength": 1.0, "time": None}
+
+
+class Rule(NamedTuple):
+    """What an event triggers: a buzz of `strength` for `time` seconds, shaped by `envelope`."""
+
+    strength: float
+    time: float
+    envelope: str
+
+
+# (event, class or None, weapon or None)
+RuleKey = tuple[str, Optional[str], Optional[str]]
+
+
+def _check_fields(rule: dict) -> None:
+    """Check the types and ranges of the fields a rule sets, raising ValueError if one is invalid."""
+    for field, maximum in _RULE_MAXIMUMS.items():
+        if field not in rule:
+            continue
+        value = rule[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Rule {rule} {field} must be a number, not {value!r}")
+        if not 0 <= value <= (maximum if maximum is not None else math.inf):
+            limit = f"from 0 to {maximum}" if maximum is not None else "at least 0"
+            raise ValueError(f"Rule {rule} {field} must be {limit}, not {value!r}")
+    for field in ("weapon", "envelope"):
+        if rule.get(field) is not None and not isinstance(rule[field], str):
+            raise ValueError(f"Rule {rule} {field} must be a name, not {rule[field]!r}")
+
+
+def _fallbacks(event: str, player_class: Optional[str], weapon: Optional[str]) -> tuple[RuleKey, ...]:
+    """The keys to look up for an event, most specific first. A weapon is more specific than a class."""
+    return (
+        (event, player_class, weapon),
+        (event, None, weapon),
+        (event, player_class, None),
+        (event, None, None),
+    )
+
+
+class RuleTable:
+    """
+    Compiled rules. Each rule in the table is complete, with the fields it doesn't set taken from the next more general
+    rule (or the defaults), so resolving an event is at most four dictionary lookups however many rules there are.
+
+    Parameters
+    ----------
+    rules : list[dict]
+        The `rules` list from config.yaml. Each rule has an `event` ("kill" or "death") and optionally a `class` (as
+        in the class configs, e.g. "heavyweapons") and a `weapon` (as in the killfeed, e.g. "sniperrifle"), and sets
+        any of `strength`, `time` and `envelope`. For deaths, the weapon is the killer's and the class is your own.
+    defaults : dict[str, Rule]
+        What each event triggers when no rule matches.
+
+    Raises
+    ------
+    ValueError
+        If a rule is malformed (strength must be from 0 to 1, time at least 0), or two rules have the same event,
+        class and weapon.
+    """
+
+    def __init__(self, rules: list[dict], defaults: dict[str, Rule]):
+        overrides: dict[RuleKey, dict] = {}
+        for rule in rules:
+            if unknown := rule.keys() - _RULE_KEYS:
+                raise ValueError(f"Unknown keys {', '.join(sorted(unknown))} in rule {rule}")
+            if rule.get("event") not in EVENTS:
+                raise ValueError(f"Rule {rule} needs an event, one of {', '.join(EVENTS)}")
+            if rule.get("class") is not None and rule["class"] not in _CLASSES:
+                raise ValueError(
+                    f"Unknown class {rule['class']!r} in rule {rule}, expected one of {', '.join(_CLASSES)}"
+                )
+            _check_fields(rule)
+            key = (rule["event"], rule.get("class"), rule.get("weapon"))
+            if key in overrides:
+                raise ValueError(f"More than one rule for event {key[0]}, class {key[1]} and weapon {key[2]}")
+            overrides[key] = {field: rule[field] for field in Rule._fields if field in rule}
+
+        self.table: dict[RuleKey, Rule] = {(event, None, None): rule for event, rule in defaults.items()}
+        # the general rules first, so the specific ones can be filled in from them
+        for key in sorted(overrides, key=lambda key: (key[2] is not None, key[1] is not None)):
+            event, player_class, weapon = key
+            self.table[key] = self.lookup(event, player_class, weapon)._replace(**overrides[key])
+
+    def lookup(self, event: str, player_class: Optional[str] = None, weapon: Optional[str] = None) -> Rule:
+        """
+        Resolve what an event triggers.
+
+        Parameters
+        ----------
+        event : str
+            "kill" or "death".
+        player_class : Optional[str]
+            The player's class, if known.
+        weapon : Optional[str]
+            The killfeed weapon name, if known.
+
+        Returns
+        -------
+        Rule
+            The most specific matching rule.
+        """
+        for key in _fallbacks(event, player_class, weapon):
+            if (rule := self.table.get(key)) is not None:
+                return rule
+        raise KeyError(f"No default rule for event {event!r}")
@@ -0,0 +1,478 @@
+"""Background screen capture of the uber bar, so grabbing frames never blocks the asyncio loop."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import collections
+import ctypes
+import ctypes.util
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from latency import LatencyRecorder
+
+
+class DXCamBackend:
+    """
+    Windows capture through dxcam, either in its continuous capture mode or one grab at a time.
+
+    Parameters
+    ----------
+    camera : DXCamera
+        The dxcam camera to capture with.
+    target_fps : int
+        Frame rate to capture at.
+    """
+
+    def __init__(self, camera, target_fps: int):
+        self.camera = camera
+        self.target_fps = target_fps
+        self._region: Optional[tuple[int, int, int, int]] = None
+        self._continuous = False
+
+    def start(self, region: tuple[int, int, int, int], continuous: bool = True) -> None:
+        """Start capturing `region` (left, top, right, bottom), continuously at target_fps or on grab_now()."""
+        self._region = region
+        self._continuous = continuous
+        if continuous:
+            # video_mode repeats the last frame while the screen doesn't change, so frames keep arriving at target_fps
+            self.camera.start(region=region, target_fps=self.target_fps, video_mode=True)
+
+    def grab(self) -> Optional[np.ndarray]:
+        """Wait for and return the next frame of continuous capture (RGB)."""
+        return self.camera.get_latest_frame()
+
+    def grab_now(self) -> Optional[np.ndarray]:
+        """Grab a single frame (RGB), None if the screen has not changed since the last grab."""
+        return self.camera.grab(region=self._region)
+
+    def stop(self) -> None:
+        """Stop capturing."""
+        if self._continuous:
+            self.camera.stop()
+            self._continuous = False
+
+
+class ImageGrabBackend:
+    """
+    Capture through PIL's ImageGrab, used on Linux.
+
+    Parameters
+    ----------
+    target_fps : int
+        Frame rate to capture at.
+    """
+
+    def __init__(self, target_fps: int):
+        self.target_fps = target_fps
+        self._region: Optional[tuple[int, int, int, int]] = None
+        self._continuous = True
+        self._next_grab = 0.0
+
+    def start(self, region: tuple[int, int, int, int], continuous: bool = True) -> None:
+        """Start capturing `region` (left, top, right, bottom), paced to target_fps by grab() if `continuous`."""
+        self._region = region
+        self._continuous = continuous
+        self._next_grab = 0.0
+
+    def grab(self) -> Optional[np.ndarray]:
+        """Wait for the next frame time (during continuous capture) and grab a frame (RGB)."""
+        if self._continuous:
+            delay = self._next_grab - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_grab = time.monotonic() + 1.0 / self.target_fps
+        return self.grab_now()
+
+    def grab_now(self) -> Optional[np.ndarray]:
+        """Grab a frame (RGB) right away."""
+        from PIL import ImageGrab  # pylint: disable=import-outside-toplevel
+
+        return np.asarray(ImageGrab.grab(bbox=self._region).convert("RGB"))
+
+    def stop(self) -> None:
+        """Stop capturing."""
+        self._region = None
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class _XImage(ctypes.Structure):
+    # leading fields of Xlib's XImage, only these are read
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+_ZPIXMAP = 2
+_ALL_PLANES = ctypes.c_ulong(-1).value
+_IPC_PRIVATE = 0
+_IPC_CREAT = 0o1000
+_IPC_RMID = 0
+
+
+class XShmBackend:
+    """
+    Linux capture through the X11 MIT-SHM extension.
+
+    Keeps one X connection and one shared memory image of the capture region for as long as capture runs, so every
+    grab is a single XShmGetImage into the same NumPy-backed buffer, with no per-frame allocation.
+
+    Parameters
+    ----------
+    target_fps : int
+        Frame rate to capture at.
+    display : str | None
+        X display to connect to, None for $DISPLAY.
+    """
+
+    # grab() returns a view of the shared segment that the next grab overwrites
+    reuses_buffer = True
+
+    def __init__(self, target_fps: int, display: Optional[str] = None):
+        self.target_fps = target_fps
+        self.display_name = display
+        self._continuous = True
+        self._next_grab = 0.0
+
+        x11 = ctypes.util.find_library("X11")
+        xext = ctypes.util.find_library("Xext")
+        if x11 is None or xext is None:
+            raise OSError("libX11 / libXext not found")
+        self._x11 = ctypes.CDLL(x11)
+        self._xext = ctypes.CDLL(xext)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self._x11.XOpenDisplay.restype = ctypes.c_void_p
+        self._x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self._x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        self._x11.XRootWindow.restype = ctypes.c_ulong
+        self._x11.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self._x11.XDefaultVisual.restype = ctypes.c_void_p
+        self._x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self._x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self._x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        self._x11.XDestroyImage.argtypes = [ctypes.POINTER(_XImage)]
+        self._x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self._xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        self._xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        self._xext.XShmCreateImage.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.c_uint,
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.POINTER(_XShmSegmentInfo),
+            ctypes.c_uint,
+            ctypes.c_uint,
+        ]
+        self._xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        self._xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        self._xext.XShmGetImage.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_ulong,
+            ctypes.POINTER(_XImage),
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_ulong,
+        ]
+        self._libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        self._libc.shmat.restype = ctypes.c_void_p
+        self._libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        self._libc.shmdt.argtypes = [ctypes.c_void_p]
+        self._libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        self._display = None
+        self._image = None
+        self._shminfo = _XShmSegmentInfo()
+        self._origin = (0, 0)
+        self._rgb_view: Optional[np.ndarray] = None
+
+    def _open_display(self) -> None:
+        display_name = self.display_name.encode() if self.display_name is not None else None
+        self._display = self._x11.XOpenDisplay(display_name)
+        if not self._display:
+            self._display = None
+            raise OSError("Could not open X display")
+        if not self._xext.XShmQueryExtension(self._display):
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+            raise OSError("X server does not support MIT-SHM")
+        self._screen = self._x11.XDefaultScreen(self._display)
+        self._root = self._x11.XRootWindow(self._display, self._screen)
+
+    def start(self, region: tuple[int, int, int, int], continuous: bool = True) -> None:
+        """Set up the shared memory image for `region` (left, top, right, bottom), paced by grab() if `continuous`."""
+        self._continuous = continuous
+        self._next_grab = 0.0
+        if self._display is None:
+            self._open_display()
+        left, top, right, bottom = region
+        width, height = right - left, bottom - top
+        self._origin = (left, top)
+
+        visual = self._x11.XDefaultVisual(self._display, self._screen)
+        depth = self._x11.XDefaultDepth(self._display, self._screen)
+        image = self._xext.XShmCreateImage(
+            self._display, visual, depth, _ZPIXMAP, None, ctypes.byref(self._shminfo), width, height
+        )
+        if not image:
+            raise OSError("XShmCreateImage failed")
+        if image.contents.bits_per_pixel != 32:
+            self._x11.XDestroyImage(image)
+            raise OSError(f"Unsupported X image format ({image.contents.bits_per_pixel} bits per pixel)")
+        size = image.contents.bytes_per_line * height
+
+        shmid = self._libc.shmget(_IPC_PRIVATE, size, _IPC_CREAT | 0o600)
+        if shmid < 0:
+            self._x11.XDestroyImage(image)
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        shmaddr = self._libc.shmat(shmid, None, 0)
+        if shmaddr in (None, ctypes.c_void_p(-1).value):
+            self._libc.shmctl(shmid, _IPC_RMID, None)
+            self._x11.XDestroyImage(image)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self._shminfo.shmid = shmid
+        self._shminfo.shmaddr = shmaddr
+        self._shminfo.readOnly = 0
+        image.contents.data = shmaddr
+        self._xext.XShmAttach(self._display, ctypes.byref(self._shminfo))
+        self._x11.XSync(self._display, 0)
+        # the segment goes away by itself once both we and the X server have detached
+        self._libc.shmctl(shmid, _IPC_RMID, None)
+        self._image = image
+
+        # BGRA rows, possibly padded; expose as an RGB view without copying
+        buffer = (ctypes.c_uint8 * size).from_address(shmaddr)
+        raw = np.ctypeslib.as_array(buffer).reshape(height, image.contents.bytes_per_line)
+        self._rgb_view = raw[:, : width * 4].reshape(height, width, 4)[..., 2::-1]
+
+    def grab(self) -> Optional[np.ndarray]:
+        """Wait for the next frame time (during continuous capture) and grab a frame into the shared buffer."""
+        if self._continuous:
+            delay = self._next_grab - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_grab = time.monotonic() + 1.0 / self.target_fps
+        return self.grab_now()
+
+    def grab_now(self) -> Optional[np.ndarray]:
+        """Grab a frame into the shared buffer (RGB view) right away."""
+        if not self._xext.XShmGetImage(self._display, self._root, self._image, *self._origin, _ALL_PLANES):
+            return None
+        return self._rgb_view
+
+    def stop(self) -> None:
+        """Release the shared memory image (the X connection is kept for the next start)."""
+        if self._image is not None:
+            self._xext.XShmDetach(self._display, ctypes.byref(self._shminfo))
+            self._x11.XSync(self._display, 0)
+            # for XShm images this only frees the XImage struct, the segment is detached below
+            self._x11.XDestroyImage(self._image)
+            self._libc.shmdt(self._shminfo.shmaddr)
+            self._image = None
+            self._rgb_view = None
+
+    def close(self) -> None:
+        """Release the image and close the X connection."""
+        self.stop()
+        if self._display is not None:
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+
+
+def create_backend(os_platform: str, target_fps: int, logger=logging):
+    """
+    Create the capture backend for a platform, importing its capture library only then.
+
+    Parameters
+    ----------
+    os_platform : str
+        The operating system platform (Linux or Windows).
+    target_fps : int
+        Frame rate to capture at.
+    logger : Logger
+        Logger to report a fallback backend to.
+
+    Returns
+    -------
+    DXCamBackend | XShmBackend | ImageGrabBackend
+        The backend: dxcam on Windows, MIT-SHM on Linux, or ImageGrab if MIT-SHM is unavailable.
+    """
+    if os_platform == "Windows":
+        import dxcam  # pylint: disable=import-outside-toplevel
+
+        return DXCamBackend(dxcam.create(), target_fps=target_fps)
+    try:
+        return XShmBackend(target_fps=target_fps)
+    except OSError as e:
+        logger.warning(f"MIT-SHM capture unavailable ({e}), falling back to ImageGrab")
+        return ImageGrabBackend(target_fps=target_fps)
+
+
+class CaptureWorker(threading.Thread):
+    """
+    Thread that keeps capturing a screen region and publishes the latest frames.
+
+    The loop reads frames with `latest()` without ever waiting on the capture. Capturing only runs while the worker is
+    active (see `set_active`), e.g. while the uber bar is on screen. With `on_demand`, a single frame is captured per
+    `request()` instead of capturing continuously.
+
+    Parameters
+    ----------
+    backend : DXCamBackend | ImageGrabBackend
+        The capture backend.
+    region : tuple[int, int, int, int]
+        The region to capture (left, top, right, bottom).
+    history : int
+        Number of recent frames to keep in the ring buffer. Backends that reuse one buffer for every grab
+        (`reuses_buffer`) have their frames copied into preallocated ring slots, so a slot is only overwritten after
+        `history` newer frames.
+    on_demand : bool
+        Capture one frame per `request()` rather than continuously.
+    latency : Optional[LatencyRecorder]
+        Records how long each capture takes, if given.
+    """
+
+    def __init__(
+        self,
+        backend,
+        region: tuple[int, int, int, int],
+        history: int = 4,
+        on_demand: bool = False,
+        latency: Optional[LatencyRecorder] = None,
+    ):
+        super().__init__(name="uber-capture", daemon=True)
+        self.backend = backend
+        self.region = region
+        self._lock = threading.Lock()
+        self._frames: collections.deque[tuple[float, np.ndarray]] = collections.deque(maxlen=history)
+        self._slots: list[Optional[np.ndarray]] = [None] * history
+        self._next_slot = 0
+        self.on_demand = on_demand
+        self._active = threading.Event()
+        self._requested = threading.Event()
+        self._stopping = threading.Event()
+        self.capture_errors = 0
+        self.latency = latency
+
+    def set_active(self, active: bool) -> None:
+        """Start or pause capturing."""
+        if active:
+            self._active.set()
+        else:
+            self._active.clear()
+
+    def request(self) -> None:
+        """Ask for a frame to be captured (on_demand mode)."""
+        self._requested.set()
+
+    def latest(self) -> tuple[Optional[np.ndarray], Optional[float]]:
+        """
+        Get the most recent frame.
+
+        Returns
+        -------
+        tuple[Optional[np.ndarray], Optional[float]]
+            The frame and its capture time (time.monotonic()), or (None, None) if nothing was captured yet.
+        """
+        with self._lock:
+            if not self._frames:
+                return None, None
+            captured_at, frame = self._frames[-1]
+        return frame, captured_at
+
+    def recent(self) -> list[tuple[float, np.ndarray]]:
+        """The frames in the ring buffer as (capture time, frame), oldest first."""
+        with self._lock:
+            return list(self._frames)
+
+    def frame_age(self) -> Optional[float]:
+        """Seconds since the latest frame was captured, or None if there is none."""
+        _, captured_at = self.latest()
+        return None if captured_at is None else time.monotonic() - captured_at
+
+    def run(self) -> None:
+        capturing = False
+        while not self._stopping.is_set():
+            if not self._active.wait(timeout=0.25):
+                if capturing:
+                    self.backend.stop()
+                    capturing = False
+                    with self._lock:
+                        # drop frames from before the pause so they can't be mistaken for current ones
+                        self._frames.clear()
+                continue
+            if self._stopping.is_set():
+                break
+            if not capturing:
+                self.backend.start(self.region, continuous=not self.on_demand)
+                capturing = True
+            if self.on_demand:
+                if not self._requested.wait(timeout=0.25):
+                    continue
+                self._requested.clear()
+            grab_started = time.monotonic()
+            try:
+                frame = self.backend.grab_now() if self.on_demand else self.backend.grab()
+            except Exception:  # pylint: disable=broad-except
+                # e.g. the display going away briefly, keep the worker alive
+                self.capture_errors += 1
+                time.sleep(0.1)
+                continue
+            with self._lock:
+                if frame is None:
+                    if not (self.on_demand and self._frames):
+                        continue
+                    # dxcam has no new frame when the screen hasn't changed, so the last one is still current
+                    frame = self._frames[-1][1]
+                elif getattr(self.backend, "reuses_buffer", False):
+                    frame = self._copy_to_slot(frame)
+                captured_at = time.monotonic()
+                self._frames.append((captured_at, frame))
+            if self.latency is not None:
+                self.latency.record("uber_capture", captured_at - grab_started)
+        if capturing:
+            self.backend.stop()
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+    def _copy_to_slot(self, frame: np.ndarray) -> np.ndarray:
+        slot = self._slots[self._next_slot]
+        if slot is None or slot.shape != frame.shape:
+            slot = self._slots[self._next_slot] = np.empty(frame.shape, dtype=frame.dtype)
+        np.copyto(slot, frame)
+        self._next_slot = (self._next_slot + 1) % len(self._slots)
+        return slot
+
+    def stop(self) -> None:
+        """Stop the worker thread."""
+        self._stopping.set()
+        self._active.set()  # wake it up if paused
+        self.join(timeout=2)
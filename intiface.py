@@ -0,0 +1,149 @@
+"""Keeps the connection to Intiface up and tracks devices as they come and go."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from buttplug import Client, WebsocketConnector
+from buttplug.messages import v3
+
+
+class IntifaceManager:
+    """
+    Connection manager for Intiface that reconnects in the background and keeps scanning for devices.
+
+    Every connection gets a fresh Client, so devices from before a reconnect never linger. `devices` is empty while
+    disconnected, and `on_change` is called whenever the live device set changes (including the connection dropping or
+    coming back), so the output can be re-sent to returning devices straight away.
+
+    Parameters
+    ----------
+    address : str
+        The Intiface websocket address.
+    name : str
+        Client name shown in Intiface.
+    on_change : Optional[Callable[[], None]]
+        Called when devices are added or removed, or the connection drops or comes back.
+    scan : bool
+        Keep scanning for new devices while connected.
+    check_interval : float
+        Seconds between connection health checks (a Ping) and device set checks.
+    check_timeout : float
+        How long a health check may take before the connection is considered dead.
+    reconnect_delay : float
+        Delay before the first reconnect attempt, doubled after every failed attempt.
+    max_reconnect_delay : float
+        Longest delay between reconnect attempts.
+    logger : Logger
+        Logger to report connection and device changes to.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        name: str = "Team Frotress 2",
+        on_change: Optional[Callable[[], None]] = None,
+        scan: bool = True,
+        check_interval: float = 1.0,
+        check_timeout: float = 2.0,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 30.0,
+        logger=logging,
+    ):
+        self.address = address
+        self.name = name
+        self.on_change = on_change
+        self.scan = scan
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.logger = logger
+        self.client: Optional[Client] = None
+        self._known_devices: dict[int, str] = {}  # device index -> name, as of the last check
+        self._scanning: Optional[asyncio.Future] = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether there is a live connection."""
+        return self.client is not None
+
+    @property
+    def devices(self) -> dict:
+        """The connected devices by index, empty while disconnected."""
+        return self.client.devices if self.client is not None else {}
+
+    async def connect(self) -> None:
+        """Make one connection attempt with a fresh client, raising if it fails."""
+        client = Client(self.name)
+        await client.connect(WebsocketConnector(self.address, logger=client.logger))
+        self.client = client
+        self._scanning = None
+        self._check_devices()
+
+    async def _disconnect(self) -> None:
+        """Drop the current client after a failure."""
+        client, self.client = self.client, None
+        self._scanning = None
+        self._check_devices()
+        try:
+            await asyncio.wait_for(client.disconnect(), timeout=self.check_timeout)
+        except Exception:  # pylint: disable=broad-except
+            # the connection is most likely gone already
+            pass
+
+    def _check_devices(self) -> None:
+        """Log devices that were added or removed since the last check and notify on_change."""
+        devices = {index: device.name for index, device in self.devices.items()}
+        if devices == self._known_devices:
+            return
+        for index in self._known_devices.keys() - devices.keys():
+            self.logger.info(f"Device removed: {self._known_devices[index]}")
+        for index in devices.keys() - self._known_devices.keys():
+            self.logger.info(f"Device added: {devices[index]}")
+        self._known_devices = devices
+        if self.on_change is not None:
+            self.on_change()
+
+    async def _keep_scanning(self) -> None:
+        """Start a new scan if the last one finished."""
+        if self._scanning is None or self._scanning.done():
+            self._scanning = await asyncio.wait_for(self.client.start_scanning(), timeout=self.check_timeout)
+
+    async def run(self) -> None:
+        """Keep the connection up until cancelled."""
+        delay = self.reconnect_delay
+        while True:
+            if self.client is None:
+                try:
+                    await self.connect()
+                except Exception as e:  # pylint: disable=broad-except
+                    self.logger.warning(f"Intiface reconnect failed ({e!r}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+                self.logger.info("Reconnected to Intiface")
+                delay = self.reconnect_delay
+
+            try:
+                if not self.client.connected:
+                    raise ConnectionError("connection closed")
+                # an unanswered Ping also catches connections that died without being closed
+                await asyncio.wait_for(self.client.send(v3.Ping()), timeout=self.check_timeout)
+                if self.scan:
+                    await self._keep_scanning()
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.warning(f"Lost connection to Intiface ({e!r}), reconnecting")
+                await self._disconnect()
+                continue
+            self._check_devices()
+            await asyncio.sleep(self.check_interval)
+
+    async def close(self) -> None:
+        """Disconnect from Intiface."""
+        if self.client is not None:
+            await self._disconnect()
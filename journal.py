@@ -0,0 +1,322 @@
+"""
+Session journal: parsed events and output strength changes in compact fixed-size binary records.
+
+Every record is 16 bytes (time, kind, flags, argument, value), so a journal can be memory-mapped straight into a NumPy
+record array and weeks of sessions analysed without parsing any text.
+
+Usage: python journal.py [directory] [--session <name>] [--json]
+"""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+import log_parser
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# file header: magic, format version, record size
+_HEADER = struct.Struct("<8sII")
+MAGIC = b"TFJOURNL"
+VERSION = 1
+# record: time (seconds since the epoch), kind, flags, argument, value
+_RECORD = struct.Struct("<dBBHf")
+HEADER_SIZE = _HEADER.size
+RECORD_SIZE = _RECORD.size
+
+# record kinds
+KILL = 1  # flags: CRIT
+DEATH = 2
+CLASS_SWITCH = 3  # argument: index into CLASSES
+SLOT_SWITCH = 4  # argument: slot
+UBER_START = 5
+UBER_END = 6  # flags: DIED if the uber ended by dying
+UBER_PERCENTAGE = 7  # value: percentage
+STRENGTH = 8  # value: output strength
+
+CRIT = 0x01
+DIED = 0x01
+
+CLASSES = tuple(log_parser.PlayerClass)
+_CLASS_INDEX = {player_class: index for index, player_class in enumerate(CLASSES)}
+
+
+class JournalWriter:
+    """
+    Appends records to journal files in a directory.
+
+    Recording only packs the record into an in-memory buffer. The buffer is written out by `run()` every
+    `flush_interval` seconds from a worker thread, so the event loop never waits on the disk. A session's journal is
+    split over numbered files of at most `max_bytes` each.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to write the journal files to.
+    max_bytes : int
+        Size a journal file may grow to before the next one is started.
+    flush_interval : float
+        Seconds between writes of the buffer.
+    clock : Callable[[], float]
+        Time source for the records.
+    logger : Logger
+        Logger to report write errors to.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        flush_interval: float = 1.0,
+        clock: Callable[[], float] = time.time,
+        logger=logging,
+    ):
+        self.directory = directory
+        # whole records only, so a file never ends in a partial one
+        self.max_bytes = max(HEADER_SIZE + RECORD_SIZE, max_bytes - (max_bytes - HEADER_SIZE) % RECORD_SIZE)
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.logger = logger
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self._buffer = bytearray()
+        self._lock = threading.Lock()  # the worker thread and close() both write
+        self._file = None
+        self._file_size = 0
+        self._part = 0
+        self._last_strength: Optional[float] = None
+        self._last_uber_percentage: Optional[float] = None
+
+    def record(self, kind: int, argument: int = 0, value: float = 0.0, flags: int = 0) -> None:
+        """Buffer a record."""
+        self._buffer += _RECORD.pack(self.clock(), kind, flags, argument, value)
+
+    def kill(self, crit: bool) -> None:
+        """Record a kill."""
+        self.record(KILL, flags=CRIT if crit else 0)
+
+    def death(self) -> None:
+        """Record a death."""
+        self.record(DEATH)
+
+    def class_switch(self, player_class: log_parser.PlayerClass) -> None:
+        """Record a class switch."""
+        self.record(CLASS_SWITCH, argument=_CLASS_INDEX[player_class])
+
+    def slot_switch(self, slot: int) -> None:
+        """Record a weapon slot switch."""
+        self.record(SLOT_SWITCH, argument=slot)
+
+    def uber(self, active: bool, died: bool = False) -> None:
+        """Record an uber starting or ending."""
+        self.record(UBER_START if active else UBER_END, flags=DIED if died else 0)
+
+    def uber_percentage(self, percentage: float) -> None:
+        """Record the uber percentage, if it changed."""
+        if percentage != self._last_uber_percentage:
+            self._last_uber_percentage = percentage
+            self.record(UBER_PERCENTAGE, value=percentage)
+
+    def strength(self, strength: float) -> None:
+        """Record the output strength, if it changed."""
+        if strength != self._last_strength:
+            self._last_strength = strength
+            self.record(STRENGTH, value=strength)
+
+    def _open_next(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._part += 1
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.session}-{self._part:03d}.tfj")
+        self._file = open(path, mode="wb")  # pylint: disable=consider-using-with
+        self._file.write(_HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        self._file_size = HEADER_SIZE
+
+    def _write(self, data: bytes) -> None:
+        """Write whole records, starting new files at the size cap."""
+        with self._lock:
+            view = memoryview(data)
+            while view:
+                if self._file is None or self._file_size >= self.max_bytes:
+                    self._open_next()
+                chunk = view[: self.max_bytes - self._file_size]
+                self._file.write(chunk)
+                self._file_size += len(chunk)
+                view = view[len(chunk) :]
+            self._file.flush()
+
+    def flush(self) -> None:
+        """Write the buffered records now, from the calling thread."""
+        data, self._buffer = bytes(self._buffer), bytearray()
+        if data:
+            self._write(data)
+
+    async def run(self) -> None:
+        """Write the buffer every `flush_interval` seconds, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            data, self._buffer = bytes(self._buffer), bytearray()
+            if not data:
+                continue
+            try:
+                await loop.run_in_executor(None, self._write, data)
+            except OSError as e:
+                self.logger.warning(f"Could not write the session journal: {e!r}")
+
+    def close(self) -> None:
+        """Write what is left and close the current file."""
+        try:
+            self.flush()
+        except OSError as e:
+            self.logger.warning(f"Could not write the session journal: {e!r}")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def record_dtype() -> np.dtype:
+    """The NumPy dtype of a journal record."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    return np.dtype([("time", "<f8"), ("kind", "u1"), ("flags", "u1"), ("argument", "<u2"), ("value", "<f4")])
+
+
+def load(path: str) -> np.ndarray:
+    """
+    Memory-map a journal file as a record array, without reading it.
+
+    Parameters
+    ----------
+    path : str
+        The journal file.
+
+    Returns
+    -------
+    np.ndarray
+        The records, with fields time, kind, flags, argument and value. A record cut off by a crash is left out.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    with open(path, mode="rb") as f:
+        magic, version, record_size = _HEADER.unpack(f.read(HEADER_SIZE))
+    if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"{path} is not a version {VERSION} session journal")
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if count == 0:
+        return np.zeros(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def sessions(directory: str) -> dict[str, list[str]]:
+    """The journal files in a directory, by session, in order."""
+    found: dict[str, list[str]] = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*-[0-9][0-9][0-9].tfj"))):
+        found.setdefault(os.path.basename(path).rsplit("-", 1)[0], []).append(path)
+    return found
+
+
+def load_session(paths: list[str]) -> np.ndarray:
+    """The records of all files of a session. A single file stays memory-mapped, several are joined."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    parts = [load(path) for path in paths]
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def session_stats(records: np.ndarray, strength_step: float = 0.05) -> dict:
+    """
+    Summarise a session.
+
+    Parameters
+    ----------
+    records : np.ndarray
+        The session's records, as from `load_session`.
+    strength_step : float
+        Width of the strength bins for the time spent at each strength.
+
+    Returns
+    -------
+    dict
+        Duration, kill / crit / death counts, kills per minute, uber count and duty cycle, and the seconds spent at
+        each strength (by the lower bound of its bin).
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    if len(records) == 0:
+        return {"duration_s": 0.0, "kills": 0, "crits": 0, "deaths": 0, "kills_per_min": 0.0, "ubers": 0}
+    times, kinds = records["time"], records["kind"]
+    start, end = float(times[0]), float(times[-1])
+    duration = end - start
+
+    kills = kinds == KILL
+    kill_count = int(np.count_nonzero(kills))
+
+    # uber duty cycle: time between each start and the end that follows it
+    uber_times = times[(kinds == UBER_START) | (kinds == UBER_END)]
+    uber_active = kinds[(kinds == UBER_START) | (kinds == UBER_END)] == UBER_START
+    uber_time = 0.0
+    if len(uber_times):
+        # each interval is active if it starts at an uber start; the last one runs to the end of the session
+        interval_ends = np.append(uber_times[1:], end)
+        uber_time = float(np.sum((interval_ends - uber_times)[uber_active]))
+
+    # time at each strength: each strength holds until the next strength change, or the end of the session
+    strength_records = records[kinds == STRENGTH]
+    time_at_strength = {}
+    if len(strength_records):
+        held = np.diff(np.append(strength_records["time"], end))
+        bins = np.floor(strength_records["value"] / strength_step + 1e-6).astype(np.int64)
+        seconds = np.bincount(bins, weights=held)
+        time_at_strength = {f"{index * strength_step:.2f}": float(s) for index, s in enumerate(seconds) if s > 0}
+
+    return {
+        "start": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start)),
+        "duration_s": duration,
+        "kills": kill_count,
+        "crits": int(np.count_nonzero(kills & (records["flags"] & CRIT).astype(bool))),
+        "deaths": int(np.count_nonzero(kinds == DEATH)),
+        "kills_per_min": kill_count / (duration / 60) if duration > 0 else 0.0,
+        "ubers": int(np.count_nonzero(kinds == UBER_START)),
+        "uber_duty_cycle": uber_time / duration if duration > 0 else 0.0,
+        "time_at_strength_s": time_at_strength,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per session statistics from the session journals.")
+    parser.add_argument("directory", nargs="?", default="journals", help="directory with the journal files")
+    parser.add_argument("--session", help="only this session (the file name without the part number)")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    args = parser.parse_args()
+
+    found_sessions = sessions(args.directory)
+    if args.session is not None:
+        found_sessions = {args.session: found_sessions.get(args.session, [])}
+    all_stats = {name: session_stats(load_session(paths)) for name, paths in found_sessions.items() if paths}
+
+    if args.json:
+        print(json.dumps(all_stats, indent=2))
+    elif not all_stats:
+        print(f"No session journals in {args.directory}")
+    for name, stats in ({} if args.json else all_stats).items():
+        print(
+            f"{name}: {stats['duration_s'] / 60:.1f} min, {stats['kills']} kills ({stats['crits']} crits), "
+            f"{stats['deaths']} deaths, {stats['kills_per_min']:.2f} kills/min, {stats['ubers']} ubers, "
+            f"uber duty cycle {stats.get('uber_duty_cycle', 0.0):.1%}"
+        )
+        for strength, seconds in stats.get("time_at_strength_s", {}).items():
+            print(f"  strength {strength}: {seconds:.1f}s")
@@ -0,0 +1,189 @@
+"""Latency instrumentation: bounded histograms per pipeline stage, a periodic summary and a local endpoint."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import threading
+import time
+from typing import Iterable
+
+# bucket upper bounds in seconds, 10 per decade from 1 µs to 10 s; anything slower lands in an overflow bucket
+BUCKET_BOUNDS = tuple(1e-6 * 10 ** (i / 10) for i in range(71))
+
+# the stages of a killfeed line on its way to the devices, in order
+STAGES = (
+    "detect_to_parse",  # console.log growth noticed -> line classified
+    "parse_to_apply",  # line classified -> event applied in VibrationHandler
+    "apply_to_send",  # event applied -> device commands written
+    "send_to_ack",  # device commands written -> acknowledged by Intiface
+    "detect_to_ack",  # end to end
+    "uber_capture",  # capturing one uber bar frame
+    "uber_analysis",  # analysing one uber bar frame
+)
+
+
+class Histogram:
+    """
+    Fixed-size histogram of durations on logarithmic buckets, so memory stays bounded however long a session runs.
+
+    Percentiles are estimated as the upper bound of the bucket they fall in, i.e. at most ~26% high.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Add a duration."""
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """Estimate a percentile (0 to 1) in seconds."""
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKET_BOUNDS[index], self.max) if index < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Summary statistics in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p90_ms": self.percentile(0.9) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class LatencyRecorder:
+    """
+    Records stage durations into histograms. Safe to record from the capture thread.
+
+    Parameters
+    ----------
+    logger : Logger
+        Logger to write the periodic summary to.
+    """
+
+    def __init__(self, logger=logging):
+        self.logger = logger
+        self.histograms: dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+
+    @staticmethod
+    def now() -> float:
+        """The clock every stage timestamp is taken with."""
+        return time.monotonic()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """Add a duration to a stage's histogram."""
+        with self._lock:
+            if (histogram := self.histograms.get(stage)) is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.record(seconds)
+
+    def since(self, stage: str, start: float) -> float:
+        """Record the time since `start` (from `now()`) for a stage, and return the current time."""
+        now = self.now()
+        self.record(stage, now - start)
+        return now
+
+    def trace_applied(self, detected_at: float, parsed_at: float, handlers: Iterable) -> None:
+        """
+        Close the parse to apply stage of a line and hand its trace on to the vibration handlers it was applied to.
+
+        Parameters
+        ----------
+        detected_at : float
+            When the line was noticed (from `now()`).
+        parsed_at : float
+            When the line was classified (from `now()`).
+        handlers : Iterable[VibrationHandler]
+            The handlers the event was applied to, which follow the trace through to the device commands.
+        """
+        applied_at = self.since("parse_to_apply", parsed_at)
+        for handler in handlers:
+            handler.trace = (detected_at, applied_at)
+
+    def to_dict(self) -> dict:
+        """All stages' statistics."""
+        with self._lock:
+            return {
+                "uptime_s": self.now() - self.started_at,
+                "stages": {stage: histogram.to_dict() for stage, histogram in self.histograms.items()},
+            }
+
+    def summary(self) -> str:
+        """Human readable summary, one line per stage that has recorded anything."""
+        lines = []
+        for stage, stats in self.to_dict()["stages"].items():
+            if stats["count"]:
+                lines.append(
+                    f"{stage:<16} n={stats['count']:<6} p50={stats['p50_ms']:.2f}ms p90={stats['p90_ms']:.2f}ms "
+                    f"p99={stats['p99_ms']:.2f}ms max={stats['max_ms']:.2f}ms"
+                )
+        return "\n".join(lines) if lines else "no latency samples yet"
+
+    async def log_summaries(self, interval: float) -> None:
+        """Log the summary every `interval` seconds, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            self.logger.info(f"Latency summary:\n{self.summary()}")
+
+    async def serve(self, port: int, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+        """
+        Serve the statistics over HTTP: JSON at /, plain text at /text.
+
+        Parameters
+        ----------
+        port : int
+            The port to listen on.
+        host : str
+            The address to listen on, local only by default.
+
+        Returns
+        -------
+        asyncio.AbstractServer
+            The server, close it when done.
+        """
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+                parts = request_line.decode("latin-1").split()
+                if len(parts) >= 2 and parts[1].startswith("/text"):
+                    body, content_type = self.summary() + "\n", "text/plain"
+                else:
+                    body, content_type = json.dumps(self.to_dict(), indent=2), "application/json"
+                payload = body.encode("UTF-8")
+                writer.write(
+                    f"HTTP/1.0 200 OK\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+            except (OSError, asyncio.TimeoutError):
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        self.logger.info(f"Latency statistics at http://{host}:{port}/ (JSON) and /text")
+        return server
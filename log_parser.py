@@ -0,0 +1,123 @@
+"""Classifies TF2 console.log lines into killfeed and class / weapon switch events."""
+
+# pylint: disable=anomalous-backslash-in-string
+
+from __future__ import annotations
+
+import enum
+import re
+from typing import NamedTuple, Optional, Union
+
+# "10/17/2026 - 21:04:13: " prefix that con_timestamp puts in front of every line
+_TIMESTAMP = rb"\d\d/\d\d/\d\d\d\d - \d\d:\d\d:\d\d: "
+
+# Cheap substring markers checked before any regex runs
+_SWITCH_MARKER = b"teamfrotress_"
+_KILL_MARKER = b" killed "
+
+# The echo is the whole line, so a player named teamfrotress_scout is not a class switch
+_SWITCH_PATTERN = re.compile(_TIMESTAMP + rb"teamfrotress_(\w+)\s*$")
+# Names are limited to 32 characters, which is up to 128 bytes of UTF-8
+_KILL_PATTERN = re.compile(_TIMESTAMP + rb"([^\n]{0,128}) killed ([^\n]{0,128}) with (\w+)\. ?(\(crit\))?")
+
+
+class PlayerClass(enum.Enum):
+    """The nine TF2 classes, named as in the class configs (`$medic`, `$heavyweapons`, ...)."""
+
+    SCOUT = "scout"
+    SOLDIER = "soldier"
+    PYRO = "pyro"
+    DEMOMAN = "demoman"
+    HEAVYWEAPONS = "heavyweapons"
+    ENGINEER = "engineer"
+    MEDIC = "medic"
+    SNIPER = "sniper"
+    SPY = "spy"
+
+
+class ClassSwitch(NamedTuple):
+    """The player switched class."""
+
+    player_class: PlayerClass
+
+
+class SlotSwitch(NamedTuple):
+    """The player switched weapon slot (1 = primary, 2 = secondary, 3 = melee)."""
+
+    slot: int
+
+
+class KillEvent(NamedTuple):
+    """A killfeed line. `by_player` / `of_player` tell whether the local player was the killer / victim."""
+
+    killer: bytes
+    victim: bytes
+    weapon: str
+    crit: bool
+    by_player: bool
+    of_player: bool
+
+
+LogEvent = Union[ClassSwitch, SlotSwitch, KillEvent]
+
+_SWITCH_TOKENS: dict[bytes, LogEvent] = {
+    **{player_class.value.encode(): ClassSwitch(player_class) for player_class in PlayerClass},
+    **{f"slot{slot}".encode(): SlotSwitch(slot) for slot in (1, 2, 3)},
+}
+
+
+class LineClassifier:
+    """
+    Single-pass classifier for console.log lines.
+
+    Parameters
+    ----------
+    name : str | None
+        The local player's name, compared against killer and victim as UTF-8 bytes so non-ASCII names work.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name.encode("UTF-8") if name is not None else None
+
+    def classify(self, line: bytes | str) -> Optional[LogEvent]:
+        """
+        Classify a single log line.
+
+        Parameters
+        ----------
+        line : bytes | str
+            The raw log line. Bytes are preferred, str lines are encoded as UTF-8 first.
+
+        Returns
+        -------
+        Optional[LogEvent]
+            The parsed event, or None if the line is not interesting.
+        """
+        if isinstance(line, str):
+            line = line.encode("UTF-8")
+
+        if _SWITCH_MARKER in line and (switch_match := _SWITCH_PATTERN.match(line)):
+            # a player name may contain the marker too, so anything but a known switch is left to the kill check
+            if (switch := _SWITCH_TOKENS.get(switch_match[1])) is not None:
+                return switch
+
+        if _KILL_MARKER in line:
+            if kill_match := _KILL_PATTERN.match(line):
+                killer, victim = kill_match[1], kill_match[2]
+                return KillEvent(
+                    killer=killer,
+                    victim=victim,
+                    weapon=kill_match[3].decode("ascii"),
+                    crit=kill_match[4] is not None,
+                    by_player=killer == self.name,
+                    of_player=victim == self.name,
+                )
+        return None
+
+
+_ANONYMOUS = LineClassifier()
+
+
+def is_kill(line: bytes | str) -> bool:
+    """Whether the line is a killfeed entry."""
+    return isinstance(_ANONYMOUS.classify(line), KillEvent)
@@ -1,48 +1,352 @@
-import re
+import asyncio
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import platform
+import struct
 import time
 
+import log_parser
+
+# inotify(7) constants, only used on Linux
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVE_SELF = 0x00000800
+_IN_DELETE_SELF = 0x00000400
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVE_SELF | _IN_DELETE_SELF
+_IN_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# number of bytes before the checkpoint offset that are hashed to recognise the same log contents again
+_FINGERPRINT_BYTES = 256
+
 
 class LogTail:
-    def __init__(self, file):
-        self.f = file
-        self.buffer = ""
+    """
+    Reads complete lines appended to a log file.
+
+    The file is read in large binary chunks and split on newlines. A trailing partial line is carried over until the
+    rest of it is written, so lines are never split or dropped, whatever bytes they contain.
+
+    Reading starts at the end of the file (or at a saved checkpoint), so existing history is never scanned. If the file
+    is truncated (e.g. by -conclearlog) or replaced (e.g. by a game restart) it is reopened and read from the start.
+
+    A checkpoint stores the inode, size and offset of the file along with a hash of the bytes just before the offset.
+    It is only resumed from if all of them still match, since -conclearlog truncates the log in place (same inode) and
+    the new log may already have grown past the old offset.
+
+    Parameters
+    ----------
+    path : str
+        Path of the log file.
+    chunk_size : int
+        Number of bytes to read per read() call.
+    start_at_end : bool
+        Start reading at the current end of the file rather than at the beginning.
+    checkpoint_path : str | None
+        File to persist the read offset in, so a restart resumes where the last run stopped.
+    checkpoint_interval : float
+        Minimum time in seconds between checkpoint writes.
+    """
 
-    def read_line(self):
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 1 << 16,
+        start_at_end: bool = True,
+        checkpoint_path: str | None = None,
+        checkpoint_interval: float = 5.0,
+    ):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = (0.0, -1)  # (time, offset)
+        # pieces of the current unfinished line, joined once its newline arrives
+        self._partial: list[bytes] = []
+        self._skip_fragment = False
+
+        self.f = open(path, "rb")  # pylint: disable=consider-using-with
+        self._inode = os.fstat(self.f.fileno()).st_ino
+        size = os.fstat(self.f.fileno()).st_size
+
+        resume_offset = self._load_checkpoint(size)
+        # whether reading resumed from a checkpoint, i.e. the first lines read were written while we weren't running
+        self.resumed = resume_offset is not None
+        if self.resumed:
+            self.f.seek(resume_offset)
+        elif start_at_end and size > 0:
+            self.f.seek(size - 1)
+            # the file may end mid-line, skip the rest of that line rather than returning a fragment
+            self._skip_fragment = self.f.read(1) != b"\n"
+
+    @property
+    def offset(self) -> int:
+        """File offset of the first byte that has not been returned as part of a complete line."""
+        return self.f.tell() - sum(len(part) for part in self._partial)
+
+    def _fingerprint(self, offset: int) -> str:
+        """Hash of the bytes just before `offset`, which differ once the log has been cleared and written again."""
+        position = self.f.tell()
+        start = max(0, offset - _FINGERPRINT_BYTES)
+        self.f.seek(start)
+        data = self.f.read(offset - start)
+        self.f.seek(position)
+        return hashlib.sha1(data).hexdigest()
+
+    def _load_checkpoint(self, size: int) -> int | None:
+        """The checkpoint offset, or None if there is none or it was saved for different log contents."""
+        if self.checkpoint_path is None or not os.path.isfile(self.checkpoint_path):
+            return None
         try:
-            temp = self.f.readline()
-        except UnicodeDecodeError:
+            with open(self.checkpoint_path, mode="r", encoding="UTF-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
             return None
-        if temp != "":
-            self.buffer += temp
-            if self.buffer.endswith("\n"):
-                line_out = self.buffer
-                self.buffer = ""
-                return line_out
+        if not isinstance(checkpoint, dict) or checkpoint.get("inode") != self._inode:
+            return None
+        offset = checkpoint.get("offset")
+        if not isinstance(offset, int) or not 0 <= offset <= checkpoint.get("size", -1) <= size:
+            # the log shrank since, so it was cleared (possibly growing again after)
+            return None
+        if checkpoint.get("fingerprint") != self._fingerprint(offset):
+            return None
+        return offset
+
+    def save_checkpoint(self) -> None:
+        """Persist the current read offset, with the file's identity and contents fingerprint, to `checkpoint_path`."""
+        if self.checkpoint_path is None:
+            return
+        offset = self.offset
+        checkpoint = {
+            "inode": self._inode,
+            "size": os.fstat(self.f.fileno()).st_size,
+            "offset": offset,
+            "fingerprint": self._fingerprint(offset),
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, mode="w", encoding="UTF-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        self._last_checkpoint = (time.monotonic(), offset)
+
+    def _maybe_save_checkpoint(self) -> None:
+        last_time, last_offset = self._last_checkpoint
+        if self.checkpoint_path is not None and time.monotonic() - last_time >= self.checkpoint_interval:
+            if self.offset != last_offset:
+                self.save_checkpoint()
+
+    def _check_rotation(self) -> bool:
+        """Reopen the log if it was replaced or truncated. Returns True if reading restarts from the beginning."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # file is being replaced right now, try again on the next read
+            return False
+        if st.st_ino != self._inode:
+            self.f.close()
+            self.f = open(self.path, "rb")  # pylint: disable=consider-using-with
+            self._inode = os.fstat(self.f.fileno()).st_ino
+        elif st.st_size < self.f.tell():
+            self.f.seek(0)
+        else:
+            return False
+        self._partial.clear()
+        self._skip_fragment = False
+        return True
+
+    def read_raw_lines(self) -> list[bytes]:
+        """
+        Read every line completed since the last call.
+
+        Returns
+        -------
+        list[bytes]
+            The new lines, without their trailing newline.
+        """
+        lines = self._read_raw_lines()
+        if not lines and self._check_rotation():
+            lines = self._read_raw_lines()
+        if lines and self._skip_fragment:
+            self._skip_fragment = False
+            del lines[0]
+        self._maybe_save_checkpoint()
+        return lines
+
+    def _read_raw_lines(self) -> list[bytes]:
+        lines: list[bytes] = []
+        while chunk := self.f.read(self.chunk_size):
+            short_read = len(chunk) < self.chunk_size
+            if b"\n" not in chunk:
+                self._partial.append(chunk)
             else:
-                return None
+                if self._partial:
+                    self._partial.append(chunk)
+                    chunk = b"".join(self._partial)
+                    self._partial.clear()
+                parts = chunk.split(b"\n")
+                tail = parts.pop()
+                if tail:
+                    self._partial.append(tail)
+                lines.extend(parts)
+            if short_read:
+                # reached the current end of the file, no need for another read() to find out
+                break
+        return lines
+
+    def read_lines(self) -> list[str]:
+        """Like `read_raw_lines`, but decoded as UTF-8 with undecodable bytes replaced."""
+        return [line.decode("UTF-8", errors="replace") for line in self.read_raw_lines()]
 
-    def read(self, pred=None):
-        temp = ""
+    def read(self, pred=None) -> str:
+        """Read all new lines matching `pred` (all lines if None), joined into one newline-terminated string."""
+        lines = self.read_lines()
         if pred is not None:
-            while line := self.read_line():
-                if pred(line):
-                    temp += line
-        else:
-            while line := self.read_line():
-                temp += line
-        return temp
+            lines = [line for line in lines if pred(line)]
+        return "".join(line + "\n" for line in lines)
+
+    def close(self) -> None:
+        """Save the checkpoint and close the file."""
+        self.save_checkpoint()
+        self.f.close()
+
+
+class LogWatcher:
+    """
+    Wakes an asyncio loop as soon as the watched log file is written to.
+
+    Uses inotify on Linux. Everywhere else (or if inotify is unavailable) the file is stat-polled with an interval that
+    starts at `min_poll_interval` after every change and doubles up to `max_poll_interval` while the file is quiet.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file to watch.
+    min_poll_interval : float
+        Shortest polling interval in seconds (polling fallback only).
+    max_poll_interval : float
+        Longest polling interval in seconds (polling fallback only).
+    """
+
+    def __init__(self, path: str, min_poll_interval: float = 0.01, max_poll_interval: float = 0.25):
+        self.path = path
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._poll_interval = min_poll_interval
+        self._last_stat = self._stat()
+
+        self._changed = asyncio.Event()
+        self._inotify_fd = None
+        self._inotify_wd = None
+        self._libc = None
+        if platform.system() == "Linux":
+            self._start_inotify()
+
+    @property
+    def uses_inotify(self) -> bool:
+        """Whether file changes are delivered by inotify rather than polling."""
+        return self._inotify_fd is not None
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _start_inotify(self) -> None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            asyncio.get_running_loop().add_reader(fd, self._on_inotify)
+        except (OSError, AttributeError, RuntimeError):
+            return
+        self._libc = libc
+        self._inotify_fd = fd
+        self._add_inotify_watch()
+
+    def _add_inotify_watch(self) -> None:
+        wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(self.path), _IN_WATCH_MASK)
+        self._inotify_wd = wd if wd >= 0 else None
+
+    def _on_inotify(self) -> None:
+        try:
+            data = os.read(self._inotify_fd, 4096)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _IN_EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = _IN_EVENT_HEADER.unpack_from(data, offset)
+            offset += _IN_EVENT_HEADER.size + name_len
+            if mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                # the file was replaced, re-arm on the next wait()
+                self._inotify_wd = None
+        self._changed.set()
+
+    async def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until the file changes or `timeout` seconds pass.
+
+        Parameters
+        ----------
+        timeout : float | None
+            Maximum time to wait in seconds, or None to wait for the next change.
+
+        Returns
+        -------
+        bool
+            True if the file changed, False on timeout.
+        """
+        if self._inotify_fd is not None and self._inotify_wd is None:
+            self._add_inotify_watch()
+        if self._inotify_fd is not None and self._inotify_wd is not None:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            self._changed.clear()
+            return True
+        return await self._poll(timeout)
+
+    async def _poll(self, timeout: float | None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stat = self._stat()
+            if stat != self._last_stat:
+                self._last_stat = stat
+                self._poll_interval = self.min_poll_interval
+                return True
+            sleep_for = self._poll_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                sleep_for = min(sleep_for, remaining)
+            await asyncio.sleep(sleep_for)
+            self._poll_interval = min(self._poll_interval * 2, self.max_poll_interval)
+
+    def close(self) -> None:
+        """Stop watching the file."""
+        if self._inotify_fd is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
 
 
 def is_kill(line):
-    return re.match(
-        """\d\d\/\d\d\/\d\d\d\d - \d\d:\d\d:\d\d: ([^\n]{0,32}) killed ([^\n]{0,32}) with (\w+)(\.|(\. \(crit\)))""",
-        line) is not None
+    return log_parser.is_kill(line)
 
 
 if __name__ == '__main__':
-    with open("E:\\Programs\\Steam\\steamapps\\common\\Team Fortress 2\\tf\\console.log", 'r') as file:
-        log = LogTail(file)
-        while True:
-            while line := log.read(is_kill):
-                print(line, end='')
-            time.sleep(0.5)
+    log = LogTail("E:\\Programs\\Steam\\steamapps\\common\\Team Fortress 2\\tf\\console.log")
+    while True:
+        while line := log.read(is_kill):
+            print(line, end='')
+        time.sleep(0.5)
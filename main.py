@@ -15,40 +15,61 @@ import os
 import platform
 import random
 import time
+import argparse
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
 
-from valve.rcon import RCON
-from PIL import ImageGrab, Image
 from ruamel.yaml import YAML
-from buttplug import Client, WebsocketConnector
-import numpy as np
-from dxcam import DXCamera
 
+import config_reload
+import event_processor
+import intiface
+import journal
+import latency
+import log_parser
 import log_tailer
+import output_renderer
+import profiling
+import rcon_client
+import server_log
+import uber_calibration
 import vibration_handler
 
+if TYPE_CHECKING:
+    # the uber bar capture path (NumPy, PIL, dxcam) is only imported once medic support is set up
+    import numpy as np
+
+    import debug_recorder
+    import uber_bar
+
+CONFIG_PATH = "config.yaml"
 PLATFORM = platform.system()
 print(f"Detected platform: {PLATFORM}")
-if PLATFORM == "Windows":
-    import dxcam
 
 if not os.path.isfile("config.py"):
     print("Copy config_default.py to config.py and edit it to set up!")
     sys.exit()
 
 
-# pylint: disable=too-many-statements
-def get_uber_bar_region(resolution: tuple[int, int], os_platform: str) -> tuple[tuple[int, int, int, int], bool]:
+def get_uber_bar_region(
+    resolution: tuple[int, int], os_platform: str, hud_dir: str, cache_path: Optional[str] = None
+) -> tuple[tuple[int, int, int, int], bool]:
     """
     Fetch the coords of the uber bar region based on the screen resolution.
 
+    The region is derived from the HUD's layout files (see uber_calibration), so any resolution and aspect ratio works,
+    and cached on disk per resolution and HUD version.
+
     Parameters
     ----------
     resolution : tuple[int, int]
         The screen resolution (width, height).
     os_platform : str
         The operating system platform (Linux or Windows).
+    hud_dir : str
+        The OMPHUD-sexy folder to read the HUD layout from.
+    cache_path : Optional[str]
+        File to cache the calibration in.
 
     Returns
     -------
@@ -57,288 +78,137 @@ def get_uber_bar_region(resolution: tuple[int, int], os_platform: str) -> tuple[
         boolean indicating if medic uber support is enabled.
     """
 
-    medic_uber_support = True
     logging.info(f"Detected platform: {os_platform}")
-    if os_platform == "Linux":
-        resolution_raw = (
-            subprocess.Popen(
-                'xrandr | grep "\*" | cut -d" " -f4', shell=True, stdout=subprocess.PIPE
-            )  # pylint: disable=anomalous-backslash-in-string
-            .communicate()[0]
-            .split()[0]
-            .split(b"x")
-        )
-        resolution = (int(resolution_raw[0].decode("UTF-8")), int(resolution_raw[1].decode("UTF-8")))
-        if resolution == (1920, 1080):
-            bar_center = (960, 744)
-            bar_width = 340
-            bar_height = 16
-            bar_left = bar_center[0] - bar_width // 2
-            bar_right = bar_center[0] + bar_width // 2
-            bar_top = bar_center[1] - bar_height // 2
-            bar_bottom = bar_center[1] + bar_height // 2
-            full_bar_region = (bar_left, bar_top, bar_right, bar_bottom)
-        elif resolution == (2560, 1440):
-            bar_topleft = (1055, 984)
-            bar_width = 450
-            bar_height = 18
-            bar_topright = (bar_topleft[0] + bar_width, bar_topleft[1])
-            bar_bottomright = (bar_topright[0], bar_topright[1] + bar_height)
-            full_bar_region = (
-                bar_topleft[0],
-                bar_topleft[1],
-                bar_bottomright[0],
-                bar_bottomright[1],
-            )
-        else:
-            medic_uber_support = False
-            full_bar_region = (0, 0, 0, 0)
-            print(
-                "Detected incompatible resolution! \
-                    Currently supported resolutions are:\n1920x1080\nMedic Uber Charge functionality will not work"
-            )
-    # This does not check for resolution and really should
-    elif os_platform == "Windows":
-        print("Widows OS: Using provided resolution.")
-        if resolution == (2560, 1440):
-            bar_topleft = (1055, 984)
-            bar_width = 450
-            bar_height = 18
-            bar_topright = (bar_topleft[0] + bar_width, bar_topleft[1])
-
-            bar_bottomright = (bar_topright[0], bar_topright[1] + bar_height)
-            full_bar_region = (
-                bar_topleft[0],
-                bar_topleft[1],
-                bar_bottomright[0],
-                bar_bottomright[1],
-            )
-            medic_uber_support = True
-        elif resolution == (1920, 1080):
-            bar_center = (960, 744)
-            bar_width = 340
-            bar_height = 16
-            bar_left = bar_center[0] - bar_width // 2
-            bar_right = bar_center[0] + bar_width // 2
-            bar_top = bar_center[1] - bar_height // 2
-            bar_bottom = bar_center[1] + bar_height // 2
-            full_bar_region = (bar_left, bar_top, bar_right, bar_bottom)
-            medic_uber_support = True
-        else:
-            medic_uber_support = False
-            full_bar_region = (0, 0, 0, 0)
-            print("Detected incompatible resolution! Compatible resolutions are 1920x1080 and 2560x1440")
-    else:
+    if os_platform not in ("Linux", "Windows"):
         print(
             "Detected incompatible operating system! \
                 Currently supported operating systems are:\nLinux and Windows"
         )
         raise NotImplementedError("Unsupported operating system")
 
-    return full_bar_region, medic_uber_support
-
-
-def get_colours_in_image(image: Image.Image) -> list[tuple[int, int, int]]:
-    """
-    Get the unique colours in the image.
-
-    Parameters
-    ----------
-    image : Image.Image
-        The image to check.
-
-    Returns
-    -------
-    list[tuple[int, int, int]]
-        A list of unique colours in the image (RGB tuples).
-    """
-    # Get the unique colours in the image
-    colours = set(image.getdata())
+    try:
+        full_bar_region = uber_calibration.calibrate(hud_dir, resolution, cache_path=cache_path)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not locate the uber bar from the HUD files ({e})! Medic Uber Charge functionality will not work")
+        return (0, 0, 0, 0), False
 
-    return list(colours)
+    return full_bar_region, True
 
 
-def colour_in_image(image: Image.Image, colour: tuple[int, int, int]) -> bool:
+def uber_percentage_grabber(
+    frame: np.ndarray,
+    analyzer: uber_bar.UberBarAnalyzer,
+    recorder: Optional[debug_recorder.FrameRecorder] = None,
+    captured_at: Optional[float] = None,
+    scanline: bool = False,
+) -> tuple[float | None, str | None]:
     """
-    Check if the image contains the specified colour.
+    Returns the current uber percentage calculated from a captured frame of the uber bar.
 
-    Parameters
+    Paramters
     ----------
-    image : Image.Image
-        The image to check.
-    colour : tuple[int, int, int]
-        The colour to check for (RGB tuple).
+    frame : np.ndarray
+        The captured uber bar region (RGB).
+    analyzer : uber_bar.UberBarAnalyzer
+        The analyzer to work out the bar state with.
+    recorder : Optional[debug_recorder.FrameRecorder]
+        Records the frame and its analysis for debugging, if given.
+    captured_at : Optional[float]
+        When the frame was captured (time.monotonic()), for the recorder.
+    scanline : bool
+        Whether the frame is a scanline region (see uber_bar.scanline_region) rather than the full bar.
 
     Returns
     -------
-    bool
-        True if the image contains the specified colour, False otherwise.
+    tuple[float | None, str | None]
+        The current uber percentage and bar state, or (None, None) if the bar is not visible.
     """
-
-    unique_colours = get_colours_in_image(image=image)
-    if colour in unique_colours:
-        return True
+    if scanline:
+        reading = analyzer.analyze_scanline(frame)
     else:
-        return False
+        reading = analyzer.analyze(frame)
+    if recorder is not None:
+        # queued for the recorder's writer thread, export frames with debug_recorder.py
+        recorder.record(
+            frame,
+            time.monotonic() if captured_at is None else captured_at,
+            reading.percentage if reading.visible else None,
+            reading.state,
+        )
+    if not reading.visible:
+        print("!! Uber requested but not visible")
+        return None, None
 
+    print(f"Uber bar status: {reading.state}, percentage: {reading.percentage:.1f}%")
 
-def only_colours_in_image(image: Image.Image, allowed_colours: list[tuple[int, int, int]]) -> bool:
-    """
-    Check if the image contains only the specified colours.
+    return reading.percentage, reading.state
 
-    Parameters
-    ----------
-    image : Image.Image
-        The image to check.
-    allowed_colours : list[tuple[int, int, int]]
-        A list of allowed colours (RGB tuples).
 
-    Returns
-    -------
-    bool
-        True if the image contains only the specified colours, False otherwise.
+def apply_vibe_config(
+    vibe_config: dict, outputs: list[tuple[vibration_handler.VibrationHandler, output_renderer.OutputRenderer]]
+) -> None:
     """
-
-    unique_colours = get_colours_in_image(image=image)
-    if set(unique_colours).issubset(set(allowed_colours)):
-        return True
-    else:
-        return False
-
-
-def colour_percentage(image: Image.Image, colour: tuple[int, int, int]) -> float:
-    """
-    Calculate the percentage of the specified colour in the image.
+    Validate a reloaded `vibe` section, then swap it into the running vibration handlers and renderers.
 
     Parameters
     ----------
-    image : Image.Image
-        The image to check (RGB mode).
-    colour : tuple[int, int, int]
-        The colour to check for (RGB tuple).
-
-    Returns
-    -------
-    float
-        The percentage of the specified colour in the image.
+    vibe_config : dict
+        The new `vibe` section of config.yaml.
+    outputs : list[tuple[vibration_handler.VibrationHandler, output_renderer.OutputRenderer]]
+        The handlers to update, each with the renderer rendering it.
+
+    Raises
+    ------
+    ValueError
+        If the settings are invalid, in which case nothing is changed.
     """
-
-    image_np = np.array(image)
-    mask = np.all(image_np == colour, axis=-1)
-    matching_pixels = np.sum(mask)
-    total_pixels = image_np.shape[0] * image_np.shape[1]
-    percentage = (matching_pixels / total_pixels) * 100
-    return percentage
-
-
-def uber_image_grabber(
-    full_bar_region: tuple[int, int, int, int], os_platform: str, dxc: Optional[DXCamera] | None = None
-) -> Image.Image:
+    params = vibration_handler.VibeParams.from_config(vibe_config)
+    rate = vibe_config.get("output_rate", 20)
+    device_rates = vibe_config.get("device_output_rates") or {}
+    if not isinstance(device_rates, dict):
+        raise ValueError(f"Vibe setting device_output_rates must map device names to rates, not {device_rates!r}")
+    if not all(isinstance(r, (int, float)) and r > 0 for r in (rate, *device_rates.values())):
+        raise ValueError("Vibe settings output_rate and device_output_rates must be positive numbers")
+    for vibe, renderer in outputs:
+        renderer.rate = rate
+        renderer.device_rates = device_rates
+        vibe.set_params(params)
+
+
+async def retry_with_backoff(
+    connect: Callable[[], Awaitable], what: str, retry: bool, initial_delay: float = 0.5, max_delay: float = 10.0
+):
     """
-    Grabs the image of the full uber bar.
+    Run a connection attempt, retrying with exponential backoff until it succeeds if `retry` is set.
 
     Parameters
     ----------
-    full_bar_region : tuple[int, int, int, int]
-        The region of the screen to grab (left, top, right, bottom).
-    os_platform : str
-        The operating system platform (Linux or Windows).
-    dxc : Optional[DXCamera]
-        The DXCamera object to use for grabbing the image (Windows only).
-
-    Returns
-    -------
-    Image.Image
-        The image of the uber bar.
+    connect : Callable[[], Awaitable]
+        Makes one connection attempt, raising if it fails.
+    what : str
+        What is being connected to, for the log.
+    retry : bool
+        Whether to retry, otherwise the first failure is raised.
+    initial_delay : float
+        Delay before the first retry in seconds, doubled after every failed attempt.
+    max_delay : float
+        Longest delay between attempts.
     """
-    if os_platform == "Linux":
-        return ImageGrab.grab(bbox=full_bar_region)
-    elif os_platform == "Windows":
-        assert dxc is not None, "DXCamera object is required for Windows"  # For type safety
-        frame = None
-        while frame is None:
-            frame = dxc.grab(region=full_bar_region)
-        return Image.fromarray(frame)
-    else:
-        raise NotImplementedError("Uber image grabber not implemented for this platform.")
-
-
-def uber_percentage_grabber(
-    uber_bar_region: tuple[int, int, int, int], os_platform: str, dxc: Optional[DXCamera], debug: bool, debug_dir: str
-) -> tuple[int | None, str | None]:
-    """
-    Returns the current uber percentage calculated from a screengrab.
-
-    Paramters
-    ----------
-    uber_bar_region : tuple[int, int, int, int]
-        The region of the screen to grab (left, top, right, bottom).
-    os_platform : str
-        The operating system platform (Linux or Windows).
-    dxc : DXCamera
-        The DXCamera object to use for grabbing the image.
-    debug : bool
-        Whether to save the image for debugging.
-    debug_dir : str
-        The directory to save the image for debugging.
-
-    Returns
-    -------
-    int
-        The current uber percentage.
-    """
-    if os_platform == "Linux":
-        img = uber_image_grabber(
-            full_bar_region=uber_bar_region,
-            os_platform=os_platform,
-        )
-    elif os_platform == "Windows":
-        img = uber_image_grabber(
-            full_bar_region=uber_bar_region,
-            os_platform=os_platform,
-            dxc=dxc,
-        )
-        if debug:
-            # Save image for debugging
-            now = time.strftime("%Y-%m-%d_%H-%M-%S")
-            img_out_path = Path(debug_dir) / f"uber_bar_{now}.png"
-            img.save(img_out_path)
-
-    colour_background = (24, 24, 24)
-    colour_regular_fill = (255, 253, 252)
-    # regular bar fill sometimes is also another colour, not sure why...
-    colour_regular_fill_alt = (255, 255, 255)
-    colour_uber_max_or_draining = (184, 217, 255)
-
-    # ensure that the image only contains the colours of the bar
-    if not only_colours_in_image(
-        image=img,
-        allowed_colours=[colour_background, colour_regular_fill, colour_uber_max_or_draining, colour_regular_fill_alt],
-    ):
-        print("!! Uber requested but not visible")
-        print(f"colours in image: {get_colours_in_image(image=img)}")
-        return None, None
-
-    bar_status = "building"
-    # if the filled colour is in the bar, then it's either full or draining
-    if colour_in_image(img, colour=colour_uber_max_or_draining):
-        filled_percentage = colour_percentage(img, colour=colour_uber_max_or_draining)
-        if filled_percentage == 100:
-            bar_status = "full"
-        else:
-            bar_status = "draining"
-    else:
-        # the bar is not full, so we calculate the percentage using the regular fill colour
-        filled_percentage = colour_percentage(img, colour=colour_regular_fill)
-        bar_status = "building"
-
-    filled_percentage_int = int(filled_percentage)
-    print(f"Uber bar status: {bar_status}, percentage: {filled_percentage_int}%")
-
-    return filled_percentage_int, bar_status
-
-
-async def main(app_config: dict, app_rcon: RCON, logfile: str, os_platform: str, dxc: Optional[DXCamera]) -> None:
+    delay = initial_delay
+    while True:
+        try:
+            return await connect()
+        except Exception as e:  # pylint: disable=broad-except
+            if not retry:
+                raise
+            logging.info(f"{what} not ready ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+async def main(
+    app_config: dict, app_rcon: rcon_client.AsyncRCON, logfile: str, os_platform: str, headless: bool = False
+) -> None:
     """
     Main function to run the Team Frotress 2 script.
 
@@ -346,182 +216,484 @@ async def main(app_config: dict, app_rcon: RCON, logfile: str, os_platform: str,
     ----------
     config : dict
         The configuration dictionary.
-    rcon : RCON
-        The RCON object to use for sending commands.
+    rcon : rcon_client.AsyncRCON
+        The RCON client to use for sending commands, connected by main().
     logfile : str
         The path to the TF2 console log file.
     os_platform : str
         The operating system platform (Linux or Windows).
-    dxc : Optional[DXCamera]
-        The DXCamera object to use for grabbing images (Windows only).
+    headless : bool
+        Keep retrying RCON and Intiface until they are up instead of giving up on the first failure.
     """
-    client = Client("Team Frotress 2")  # :3
-
-    connector = WebsocketConnector(app_config["networking"]["intiface_server_addr"], logger=client.logger)
-
-    console = log_tailer.LogTail(logfile)
-    _ = console.read()
+    networking = app_config["networking"]
+    # reconnects and picks up devices in the background once running, so devices may come and go mid-match
+    intiface_manager = intiface.IntifaceManager(
+        networking["intiface_server_addr"],
+        "Team Frotress 2",  # :3
+        scan=networking.get("intiface_scan", True),
+        max_reconnect_delay=networking.get("intiface_max_reconnect_delay", 30.0),
+    )
+
+    console = None
+    console_watcher = None
+    latency_recorder = None
+    latency_server = None
+    session_journal = None
+    uber_capture = None
+    frame_recorder = None
+    # everything run in the background until the session ends
+    background_tasks: list[asyncio.Task] = []
+
+    async def open_console() -> log_tailer.LogTail:
+        # starts at the end of console.log (or at the checkpoint of the last run), so old history is never read
+        return log_tailer.LogTail(logfile, checkpoint_path=app_config["paths"].get("log_checkpoint"))
 
     try:
-        await client.connect(connector)
-    except Exception:  # pylint: disable=broad-except
-        logging.error("Could not connect!")
-        return
-
-    client.logger.info("Connected to Intiface!")
-
-    if len(client.devices) == 0:
-        logging.error("No devices!")
-        return
-
-    logging.info("Executing Team Frotress config files")
-
-    # enables class and weapon switch functionality
-    app_rcon.execute("exec teamfrotress")
-    if app_config["tf2"]["enable_weaponswitch"]:
-        # anxious-doe: unsure what this does, leaving it alone
-        app_rcon.execute("exec teamfrotress_switcher")
-
-    # get steam username to detect killfeed data
-    match_name = None
-    logging.info("Getting name...")
-    while match_name is None:
-        try:
-            name_response = app_rcon.execute("name")
-            name_response_text = name_response.text
+        # TF2 (which creates console.log) and Intiface start up independently, so wait for all of them at once
+        rcon_ready, intiface_ready, console = await asyncio.gather(
+            retry_with_backoff(app_rcon.start, "RCON", retry=headless),
+            retry_with_backoff(intiface_manager.connect, "Intiface", retry=headless),
+            retry_with_backoff(open_console, "console.log", retry=headless),
+            return_exceptions=True,
+        )
+        console_error = None
+        if isinstance(console, Exception):
+            console_error, console = console, None
+        if isinstance(rcon_ready, Exception):
+            logging.error(f"Could not connect to RCON server: {rcon_ready!r}")
+            return
+        logging.info("Connected to RCON server")
+        if isinstance(intiface_ready, Exception):
+            logging.error("Could not connect!")
+            return
+        if console_error is not None:
+            logging.error(f"Could not open {logfile}: {console_error!r}")
+            return
+        # wakes the loop as soon as TF2 writes to console.log instead of waiting for the next tick
+        console_watcher = log_tailer.LogWatcher(app_config["paths"]["tf2_console_log"])
+
+        logging.info("Connected to Intiface!")
+
+        if len(intiface_manager.devices) == 0:
+            logging.warning("No devices yet, they will be picked up as soon as they connect")
+
+        logging.info("Executing Team Frotress config files")
+
+        # enables class and weapon switch functionality
+        app_rcon.submit("exec teamfrotress")
+        if app_config["tf2"]["enable_weaponswitch"]:
+            # anxious-doe: unsure what this does, leaving it alone
+            app_rcon.submit("exec teamfrotress_switcher")
+
+        # get steam username to detect killfeed data
+        match_name = None
+        logging.info("Getting name...")
+        while match_name is None:
+            try:
+                name_response_text = await app_rcon.execute("name")
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                # the RCON client reconnects in the background, ask again once it is back
+                logging.warning(f"No answer to the name query ({e!r}), asking again")
+                await asyncio.sleep(1.0)
+                continue
             match_name = re.match(
                 pattern='"name" = "([^\n]+)" \( def. "unnamed" \)', string=name_response_text
             )  # pylint: disable=anomalous-backslash-in-string
-        except UnicodeDecodeError:
-            pass
+            if match_name is None:
+                await asyncio.sleep(0.1)
+
+        name = match_name[1]
+        logging.info(f"Got name: {name}")
+
+        logging.info("Ready to play!")
+
+        current_uber = 0
+        last_seen_uber_percentage = 0
+        last_seen_uber_time = time.monotonic()
+        last_uber = 0
+        currently_ubered = False
+        resolution = tuple(app_config["tf2"]["resolution"])  # need to convert to tuple since yaml loads as list
+        uber_bar_region, medic_uber_support = get_uber_bar_region(
+            resolution=resolution,
+            os_platform=os_platform,
+            hud_dir=app_config["paths"].get("hud_dir", "omphudsexy"),
+            cache_path=app_config["paths"].get("uber_calibration_cache"),
+        )
+        logging.info(f"Uber bar region: {uber_bar_region}, medic_uber_support: {medic_uber_support}")
+
+        # optional instrumentation of how long each stage from console.log line to device takes
+        latency_config = app_config.get("latency", {})
+        latency_recorder = latency.LatencyRecorder(logging) if latency_config.get("enabled", False) else None
+        if latency_recorder is not None:
+            if (summary_interval := latency_config.get("summary_interval", 60)) > 0:
+                background_tasks.append(asyncio.create_task(latency_recorder.log_summaries(summary_interval)))
+            if latency_config.get("http_port", 0):
+                latency_server = await latency_recorder.serve(latency_config["http_port"])
+
+        # binary journal of the session's events and output strength, for `python journal.py` statistics
+        journal_config = app_config.get("journal", {})
+        if journal_config.get("enabled", False):
+            session_journal = journal.JournalWriter(
+                journal_config.get("directory", "journals"),
+                max_bytes=int(journal_config.get("max_file_size", 64) * 1024 * 1024),
+            )
+            background_tasks.append(asyncio.create_task(session_journal.run()))
+
+        uber_analyzer = None
+        uber_scanline = False
+        uber_estimator = None
+        next_capture_at = 0.0
+        capture_pending = False
+        last_analyzed_at = None
+        was_uber_visible = False
+        max_frame_age = app_config["tf2"].get("max_frame_age", 0.5)
+        if medic_uber_support:
+            # the capture path pulls in NumPy and the platform's capture library, so it is only loaded when needed
+            # pylint: disable=import-outside-toplevel
+            import frame_capture
+            import uber_bar
+            import uber_model
+
+            uber_analyzer = uber_bar.UberBarAnalyzer(tolerance=app_config["tf2"].get("uber_colour_tolerance", 4))
+            uber_scanline = app_config["tf2"].get("uber_sampling", "full") == "scanline"
+            if uber_scanline:
+                # only capture a few rows through the middle of the bar
+                uber_bar_region = uber_bar.scanline_region(
+                    uber_bar_region, rows=app_config["tf2"].get("uber_scanline_rows", 1)
+                )
+                logging.info(f"Uber scanline sampling region: {uber_bar_region}")
 
-    name = match_name[1]
-    logging.info(f"Got name: {name}")
+            # predicts uber charge between captures, so the bar is only captured when something is about to happen
+            uber_estimator = uber_model.UberEstimator(
+                milestones=app_config["vibe"]["uber_milestones"],
+                dense_interval=app_config["tf2"].get("uber_capture_dense_interval", 0.05),
+                sparse_interval=app_config["tf2"].get("uber_capture_sparse_interval", 1.0),
+            )
 
-    logging.info("Ready to play!")
+            # frames are captured on a worker thread (when requested, or continuously while the bar is on screen), the
+            # loop only ever picks up the latest one
+            capture_backend = frame_capture.create_backend(
+                os_platform, target_fps=round(1.0 / uber_estimator.dense_interval), logger=logging
+            )
+            uber_capture = frame_capture.CaptureWorker(
+                capture_backend,
+                region=uber_bar_region,
+                on_demand=app_config["tf2"].get("uber_capture_mode", "on_demand") != "continuous",
+                latency=latency_recorder,
+            )
+            uber_capture.start()
 
-    current_uber = 0
-    last_seen_uber_percentage = 0
-    last_seen_uber_time = time.time()
-    last_uber = 0
-    currently_ubered = False
-    curr_class = ""
-    curr_weapon = -1
-    resolution = tuple(app_config["tf2"]["resolution"])  # need to convert to tuple since yaml loads as list
-    uber_bar_region, medic_uber_support = get_uber_bar_region(resolution=resolution, os_platform=os_platform)
-    logging.info(f"Uber bar region: {uber_bar_region}, medic_uber_support: {medic_uber_support}")
+            if app_config["debug"]:
+                import debug_recorder
 
-    logging.info("Setting up vibe handler")
-    vibe = vibration_handler.VibrationHandler(logging, app_rcon, config=app_config["vibe"])
+                # recent frames with their analysis go to a fixed-size ring file off the loop
+                frame_recorder = debug_recorder.FrameRecorder(
+                    Path(app_config["paths"]["debug_save_dir"]) / "uber_frames.ring",
+                    max_bytes=int(app_config.get("debug_frames_max_size", 64) * 1024 * 1024),
+                )
+                frame_recorder.start()
 
-    logging.info("### ready! ###")
+        logging.info("Setting up vibe handler")
+        vibe = vibration_handler.VibrationHandler(
+            logging, app_rcon, config=app_config["vibe"], latency=latency_recorder, journal=session_journal
+        )
+        events = event_processor.EventProcessor(
+            logging, log_parser.LineClassifier(name), vibe, latency=latency_recorder, journal=session_journal
+        )
 
-    while True:
-        # detect kills & class / weapon switches from console log
-        while True:
-            line = console.read_line()
-            if line is None:
-                break
-
-            if switch_match := re.match(
-                """\d\d\/\d\d\/\d\d\d\d - \d\d:\d\d:\d\d: teamfrotress_(\w+)""",
-                string=line,
-            ):
-                if switch_match[1] in [
-                    "scout",
-                    "soldier",
-                    "pyro",
-                    "heavyweapons",
-                    "demoman",
-                    "engineer",
-                    "medic",
-                    "sniper",
-                    "spy",
-                ]:
-                    curr_class = switch_match[1]
-                    logging.info(f"New class: {curr_class}")
-                    vibe.killstreak = 0
-                    vibe.uberstreak = 0
-
-                elif switch_match[1] in ["slot1", "slot2", "slot3"]:
-                    curr_weapon = int(switch_match[1][-1])
-
-            if killfeed_match := re.match(
-                pattern="""\d\d\/\d\d\/\d\d\d\d - \d\d:\d\d:\d\d: ([^\n]{0,32}) killed ([^\n]{0,32}) with (\w+)\. ?(\(crit\))?""",  # pylint: disable=line-too-long
-                string=line,
-            ):
-
-                if killfeed_match[1] == name:  # we got a kill
-                    print(f"Kill logged, streak: {vibe.killstreak}{', crit' if killfeed_match[4] is not None else ''}")
-                    vibe.kill(killfeed_match[4] is not None)
-                if killfeed_match[2] == name:  # we died :(
-                    logging.info("Death logged")
-                    vibe.death()
-
-        if curr_class == "medic" and medic_uber_support and (curr_weapon == 2 or curr_weapon == 3):
-            uber_grabbed, bar_status = uber_percentage_grabber(
-                uber_bar_region=uber_bar_region,
-                os_platform=os_platform,
-                dxc=dxc,
-                debug=app_config["debug"],
-                debug_dir=app_config["paths"]["debug_save_dir"],
+        if console.resumed:
+            # catch up on class / weapon switches made while we weren't running, without replaying old kills
+            events.catch_up(console.read_raw_lines())
+            logging.info(f"Resumed console.log from checkpoint, class: {events.curr_class}, slot: {events.curr_weapon}")
+
+        # device output runs in its own task, at its own rate
+        renderer = output_renderer.OutputRenderer(
+            vibe,
+            rate=app_config["vibe"].get("output_rate", 20),
+            device_rates=app_config["vibe"].get("device_output_rates", {}),
+        )
+        render_task = asyncio.create_task(renderer.run(lambda: intiface_manager.devices))
+        intiface_task = asyncio.create_task(intiface_manager.run())
+        background_tasks += [render_task, intiface_task]
+
+        def devices_changed() -> None:
+            # drop what was sent to devices that went away, and wake the renderer so returning devices get the
+            # current strength right away
+            vibe.forget_removed(intiface_manager.devices)
+            vibe.changed.set()
+
+        intiface_manager.on_change = devices_changed
+
+        reload_task = None
+        if app_config.get("hot_reload", True):
+            reloader = config_reload.ConfigReloader(
+                CONFIG_PATH, lambda new_config: apply_vibe_config(new_config["vibe"], [(vibe, renderer)])
             )
-            # logging.info(f"New uber: {uber_grabbed}")
-        else:
+            reload_task = asyncio.create_task(reloader.run())
+            background_tasks.append(reload_task)
+
+        logging.info("### ready! ###")
+
+        while True:
+            for task in (render_task, reload_task):
+                if task is not None and task.done():
+                    # surface the task's exception, it should never stop on its own
+                    task.result()
+
+            # detect kills & class / weapon switches from console log
+            detected_at = latency_recorder.now() if latency_recorder is not None else None
+            for line in console.read_raw_lines():
+                event = events.handle_line(line, detected_at)
+                if uber_estimator is not None and (
+                    isinstance(event, log_parser.ClassSwitch)
+                    or (isinstance(event, log_parser.KillEvent) and event.of_player)
+                ):
+                    # the charge starts over after dying or a class switch, the old build rate says nothing about it
+                    uber_estimator.reset()
+                    next_capture_at = 0.0
+
+            uber_visible = medic_uber_support and events.uber_bar_visible
             uber_grabbed = None
             bar_status = "unknown"
+            if uber_capture is not None:
+                uber_capture.set_active(uber_visible)
+            if uber_visible:
+                now = time.monotonic()
+                if not was_uber_visible:
+                    # bar just came on screen, capture right away. The charge may have changed at any rate while it
+                    # was hidden, so start the model over
+                    uber_estimator.reset()
+                    next_capture_at = now
+                frame, captured_at = uber_capture.latest()
+                # a stale frame (e.g. capture stalled) could show a bar that has changed since, ignore it. Continuous
+                # capture delivers frames all the time, only the ones a scheduled capture is waiting for are analysed
+                fresh = frame is not None and captured_at != last_analyzed_at and now - captured_at <= max_frame_age
+                if fresh and capture_pending:
+                    last_analyzed_at = captured_at
+                    capture_pending = False
+                    analysis_started = time.monotonic()
+                    uber_grabbed, bar_status = uber_percentage_grabber(
+                        frame=frame,
+                        analyzer=uber_analyzer,
+                        recorder=frame_recorder,
+                        captured_at=captured_at,
+                        scanline=uber_scanline,
+                    )
+                    if latency_recorder is not None:
+                        latency_recorder.since("uber_analysis", analysis_started)
+                    if uber_grabbed is not None:
+                        uber_estimator.add_sample(captured_at, uber_grabbed, bar_status)
+                        next_capture_at = uber_estimator.next_capture_time(captured_at)
+                    else:
+                        next_capture_at = captured_at + uber_estimator.sparse_interval
+                if now >= next_capture_at:
+                    if uber_capture.on_demand:
+                        uber_capture.request()
+                    capture_pending = True
+                    # retry if the frame doesn't turn up, e.g. dxcam had nothing for the first grab
+                    next_capture_at = now + max_frame_age
+            was_uber_visible = uber_visible
+
+            # handle uber
+            # note that uber will not always be grabbable even while uber is active since switching to primary will hide
+            # the bar.
+            if uber_grabbed is not None:
+                last_uber = current_uber
+                current_uber = uber_grabbed
+                last_seen_uber_percentage = current_uber
+                last_seen_uber_time = time.monotonic()
+                if session_journal is not None:
+                    session_journal.uber_percentage(current_uber)
+
+                if not currently_ubered:
+                    if bar_status == "draining":
+                        # uber activated
+                        logging.info("Activated Uber!")
+                        currently_ubered = True
+                        vibe.start_uber()
+
+                # check for increase in uber - note this sometimes happens during an uber due to use of ubersaw
+                if current_uber > last_uber:
+                    vibe.uber_milestone(current_uber, last_uber)
+
+                # uber ended - threhold is 5% since the exact frame of 0 might be skipped
+                if currently_ubered and (current_uber < 5):
+                    print(f"Uber ended, current: {current_uber}")
+                    currently_ubered = False
+                    vibe.end_uber()
+            # ubered but bar not visible
+            elif currently_ubered:
+                # calculate the amount of time that the current uber has left based on last percentage and time
+                time_since_last_seen = time.monotonic() - last_seen_uber_time
+                last_seen_uber_time_estimate = last_seen_uber_percentage / 100 * 8  # 8 seconds is max uber duration
+                if time_since_last_seen > last_seen_uber_time_estimate:
+                    # end uber
+                    currently_ubered = False
+                    vibe.end_uber()
+                    print(
+                        f"uber ended since bar not visible for {time_since_last_seen} seconds and last seen percentage"
+                        f" was {last_seen_uber_percentage}%"
+                    )
+
+            # Sleep until the next thing that changes on its own (an uber running out, a scheduled uber bar capture), or
+            # until console.log is written to. Buzzes are rendered to the devices by the renderer task.
+            now = time.monotonic()
+            wake_times = []
+            if currently_ubered and not uber_visible:
+                wake_times.append(last_seen_uber_time + last_seen_uber_percentage / 100 * 8)
+            if uber_visible:
+                # wake up for the next scheduled capture, or shortly after requesting one to pick up the frame
+                wake_times.append(now + uber_estimator.dense_interval if capture_pending else next_capture_at)
+            tick_timeout = max(0.0, min(wake_times) - now) if wake_times else None
+            await console_watcher.wait(timeout=tick_timeout)
+
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await intiface_manager.close()
+        if latency_server is not None:
+            latency_server.close()
+        if latency_recorder is not None:
+            logging.info(f"Latency summary:\n{latency_recorder.summary()}")
+        if session_journal is not None:
+            session_journal.close()
+        await app_rcon.close()
+        if uber_capture is not None:
+            uber_capture.stop()
+        if frame_recorder is not None:
+            frame_recorder.close()
+        if console_watcher is not None:
+            console_watcher.close()
+        if console is not None:
+            console.close()
+
+
+async def server_main(app_config: dict, headless: bool = False) -> None:
+    """
+    Trigger vibes for the players of a whole server from its UDP log stream (`logaddress_add`) instead of console.log.
 
-        # handle uber
-        # note that uber will not always be grabbable even while uber is active since switching to primary will hide
-        # the bar.
-        if uber_grabbed is not None:
-            last_uber = current_uber
-            current_uber = uber_grabbed
-            last_seen_uber_percentage = current_uber
-            last_seen_uber_time = time.time()
-
-            if not currently_ubered:
-                if bar_status == "draining":
-                    # uber activated
-                    logging.info("Activated Uber!")
-                    currently_ubered = True
-                    vibe.start_uber()
-
-            # check for increase in uber - note this sometimes happens during an uber due to use of ubersaw
-            if current_uber > last_uber:
-                vibe.uber_milestone(current_uber, last_uber)
-
-            # uber ended - threhold is 5% since the exact frame of 0 might be skipped
-            if currently_ubered and (current_uber < 5):
-                print(f"Uber ended, current: {current_uber}")
-                currently_ubered = False
-                vibe.end_uber()
-        # ubered but bar not visible
-        elif currently_ubered:
-            # calculate the amount of time that the current uber has left based on last percentage and time
-            time_since_last_seen = time.time() - last_seen_uber_time
-            last_seen_uber_time_estimate = last_seen_uber_percentage / 100 * 8  # 8 seconds is max uber duration
-            if time_since_last_seen > last_seen_uber_time_estimate:
-                # end uber
-                currently_ubered = False
-                vibe.end_uber()
-                print(
-                    f"uber ended since bar not visible for {time_since_last_seen} seconds and last seen percentage"
-                    f" was {last_seen_uber_percentage}%"
-                )
+    Every player in `server_log.players` gets their own VibrationHandler driving their own devices. TF2 commands can't
+    be run on the players' clients, so the activate / deactivate commands are not used.
 
-        # run vibrator
-        await vibe.run_buzz(devices=client.devices)
-        await asyncio.sleep(1.0 / app_config["tf2"]["update_speed"])
+    Parameters
+    ----------
+    app_config : dict
+        The application configuration.
+    headless : bool
+        Keep retrying Intiface until it is up instead of giving up on the first failure.
+    """
+    server_config = app_config["server_log"]
+    players: dict[str, list[str]] = server_config.get("players") or {}
+    if not players:
+        logging.error("No players set up in server_log.players")
+        return
+
+    intiface_manager = intiface.IntifaceManager(
+        app_config["networking"]["intiface_server_addr"],
+        "Team Frotress 2",
+        scan=app_config["networking"].get("intiface_scan", True),
+        max_reconnect_delay=app_config["networking"].get("intiface_max_reconnect_delay", 30.0),
+    )
+    try:
+        await retry_with_backoff(intiface_manager.connect, "Intiface", retry=headless)
+    except Exception as e:  # pylint: disable=broad-except
+        logging.error(f"Could not connect to Intiface: {e!r}")
+        return
+    logging.info("Connected to Intiface!")
+
+    latency_config = app_config.get("latency", {})
+    latency_recorder = latency.LatencyRecorder(logging) if latency_config.get("enabled", False) else None
+
+    def server_vibe_config(config: dict) -> dict:
+        return {**config["vibe"], "activate_command": "", "deactivate_command": ""}
+
+    vibe_config = server_vibe_config(app_config)
+    vibes: dict[str, vibration_handler.VibrationHandler] = {}
+    player_devices: dict[str, Callable[[], dict]] = {}
+    for player, device_names in players.items():
+        vibes[player] = vibration_handler.VibrationHandler(logging, None, config=vibe_config, latency=latency_recorder)
+        player_devices[player] = lambda names=frozenset(device_names): {
+            index: device for index, device in intiface_manager.devices.items() if device.name in names
+        }
+
+    render_tasks = []
+    outputs = []
+    for player, vibe in vibes.items():
+        renderer = output_renderer.OutputRenderer(
+            vibe,
+            rate=vibe_config.get("output_rate", 20),
+            device_rates=vibe_config.get("device_output_rates", {}),
+        )
+        outputs.append((vibe, renderer))
+        render_tasks.append(asyncio.create_task(renderer.run(player_devices[player])))
+
+    def devices_changed() -> None:
+        for player, vibe in vibes.items():
+            vibe.forget_removed(player_devices[player]())
+            vibe.changed.set()
+
+    intiface_manager.on_change = devices_changed
+    intiface_task = asyncio.create_task(intiface_manager.run())
+    watched_tasks = [*render_tasks, intiface_task]
+    if app_config.get("hot_reload", True):
+        # one parameter set shared by every player, swapped for all of them at once
+        reloader = config_reload.ConfigReloader(
+            CONFIG_PATH, lambda new_config: apply_vibe_config(server_vibe_config(new_config), outputs)
+        )
+        watched_tasks.append(asyncio.create_task(reloader.run()))
+
+    router = server_log.ServerLogRouter(logging, vibes, latency=latency_recorder)
+    secret = server_config.get("secret")
+    host, port = server_config.get("listen_addr", "0.0.0.0"), server_config.get("port", 27500)
+    transport, protocol = await server_log.listen(
+        router, host, port, secret=str(secret).encode("UTF-8") if secret is not None else None
+    )
+    logging.info(f"Receiving server logs on {host}:{port} for {len(vibes)} players, run logaddress_add on the server")
+    logging.info("### ready! ###")
+
+    try:
+        # everything runs in the datagram endpoint and the renderer tasks, only watch that they keep running
+        while True:
+            for task in watched_tasks:
+                if task.done():
+                    task.result()
+            await asyncio.sleep(1.0)
+    finally:
+        transport.close()
+        logging.info(f"Received {protocol.packets} log packets, {protocol.dropped} dropped")
+        for task in watched_tasks:
+            task.cancel()
+        await intiface_manager.close()
+        if latency_recorder is not None:
+            logging.info(f"Latency summary:\n{latency_recorder.summary()}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Team Frotress 2")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="don't prompt, wait for TF2 and Intiface to come up on their own (e.g. under a process supervisor)",
+    )
+    parser.add_argument("--no-launch", action="store_true", help="don't launch TF2, e.g. when it is already running")
+    parser.add_argument(
+        "--server-log",
+        action="store_true",
+        help="follow every player in server_log.players from a game server's UDP log stream instead of TF2",
+    )
+    args = parser.parse_args()
 
     # Load yaml config from config.yaml
     yaml = YAML(typ="safe")
-    with open(Path("config.yaml"), encoding="UTF-8") as f:
+    with open(Path(CONFIG_PATH), encoding="UTF-8") as f:
         config = yaml.load(f)
 
+    if args.server_log:
+        # no local TF2 involved, so no launching, RCON or console.log
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+        asyncio.run(server_main(config, headless=args.headless))
+        sys.exit()
+
     config_paths = config["paths"]
     config_networking = config["networking"]
     config_tf2 = config["tf2"]
@@ -533,8 +705,9 @@ if __name__ == "__main__":
     if debug_mode:
         print(f"Debug mode enabled, saving debug logs to {debug_save_dir}")
 
-    print("Press enter to launch TF2!")
-    input()
+    if not args.headless:
+        print("Press enter to launch TF2!")
+        input()
 
     # Set up networking
 
@@ -564,32 +737,54 @@ if __name__ == "__main__":
     ).split()
     tf2_args.extend(added_args)
 
-    print("Launching TF2 with the following arguments:")
-    print(" ".join(tf2_args))
-    subprocess.Popen(args=tf2_args)
+    if not args.no_launch:
+        print("Launching TF2 with the following arguments:")
+        print(" ".join(tf2_args))
+        subprocess.Popen(args=tf2_args)
 
-    print("Wait until TF2 has made it to the main menu, then press enter")
-    input()
+    if not args.headless:
+        print("Wait until TF2 has made it to the main menu, then press enter")
+        input()
 
-    try:
-        print("Connecting to RCON server at " + str(address) + " with password: " + RCON_PASSWORD)
-        rcon = RCON(address=address, password=RCON_PASSWORD)
-        rcon.connect()
-        print("Connected to RCON server")
-        rcon.authenticate()
-    except Exception as e:  # pylint: disable=broad-except
-        print(f"Could not connect to RCON server: {e}")
-        exit()
-
-    if PLATFORM == "Windows":
-        DXCAMERA = dxcam.create()
-    else:
-        DXCAMERA = None
+    print("Connecting to RCON server at " + str(address) + " with password: " + RCON_PASSWORD)
+    rcon = rcon_client.AsyncRCON(
+        address=address,
+        password=RCON_PASSWORD,
+        command_timeout=config_networking.get("rcon_command_timeout", 5.0),
+    )
 
-    print("Ensure Intiface Central is running and has your device connected, then press enter")
-    input()
+    if not args.headless:
+        print("Ensure Intiface Central is running and has your device connected, then press enter")
+        input()
 
     logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
-    with open(config_paths["tf2_console_log"], mode="r", encoding="UTF-8") as f:
-        asyncio.run(main(app_config=config, app_rcon=rcon, logfile=f, os_platform=PLATFORM, dxc=DXCAMERA))
+    profiler = None
+    if config.get("profiling", {}).get("enabled", False):
+        # account the main stages of the loop separately in the reports
+        profiler = profiling.Profiler(
+            output_dir=config["profiling"].get("output_dir", "profiles"),
+            trace_frames=config["profiling"].get("trace_frames", 1),
+        )
+        uber_percentage_grabber = profiler.wrap("uber_analysis", uber_percentage_grabber)
+        event_processor.EventProcessor.handle_line = profiler.wrap(
+            "log_events", event_processor.EventProcessor.handle_line
+        )
+        output_renderer.OutputRenderer.render = profiler.wrap_async(
+            "device_output", output_renderer.OutputRenderer.render
+        )
+        profiler.start()
+
+    try:
+        asyncio.run(
+            main(
+                app_config=config,
+                app_rcon=rcon,
+                logfile=config_paths["tf2_console_log"],
+                os_platform=PLATFORM,
+                headless=args.headless,
+            )
+        )
+    finally:
+        if profiler is not None:
+            profiler.stop()
@@ -0,0 +1,109 @@
+"""Renders the vibration strength to the devices at a fixed rate, independently of the main loop."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable, Optional
+
+from vibration_handler import VibrationHandler
+
+
+class OutputRenderer:
+    """
+    Sends the vibration strength to the devices from its own task, so the input side (log parsing, uber bar capture)
+    never delays or jitters the output.
+
+    While an envelope is animating the strength, each device is rendered at its own rate. Otherwise the renderer sleeps
+    until the strength next changes: a buzz ending, a keep-alive, a retry of a command a device failed to accept, or a
+    new buzz / uber signalled by `vibe.changed`.
+
+    Parameters
+    ----------
+    vibe : VibrationHandler
+        The vibration handler to render.
+    rate : float
+        Default render rate per device while animating, in Hz.
+    device_rates : Optional[dict[str, float]]
+        Render rates for specific devices, by device name.
+    clock : Callable[[], float]
+        Time source, the same as the vibration handler's.
+    """
+
+    def __init__(
+        self,
+        vibe: VibrationHandler,
+        rate: float = 20.0,
+        device_rates: Optional[dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.vibe = vibe
+        self.rate = rate
+        self.device_rates = device_rates or {}
+        self.clock = clock
+        self._next_render: dict[int, float] = {}  # device index -> when it is due to be rendered again
+
+    def interval(self, device) -> float:
+        """Seconds between renders of a device while animating."""
+        return 1.0 / self.device_rates.get(device.name, self.rate)
+
+    async def render(self, devices: dict) -> Optional[float]:
+        """
+        Render the current strength to the devices that are due.
+
+        Parameters
+        ----------
+        devices : dict
+            The connected devices, by device index.
+
+        Returns
+        -------
+        Optional[float]
+            When to render next (in `clock` time), or None to wait until `vibe.changed` is set.
+        """
+        if self.vibe.changed.is_set():
+            # something new started or ended, every device is due right away
+            self.vibe.changed.clear()
+            self._next_render.clear()
+
+        now = self.clock()
+        strength = self.vibe.update()
+        self.vibe.forget_removed(devices)
+        self._next_render = {index: due for index, due in self._next_render.items() if index in devices}
+
+        animating = self.vibe.animating
+        if animating:
+            due = {index: device for index, device in devices.items() if self._next_render.get(index, now) <= now}
+        else:
+            # the strength only changes at the times returned below, so every device is rendered at each of them
+            due = devices
+        for index, device in due.items():
+            self._next_render[index] = now + self.interval(device)
+        if due:
+            await self.vibe.output(due, strength, now)
+
+        if animating:
+            return min(self._next_render.values(), default=now + 1.0 / self.rate)
+        wake_times = [
+            t for t in (self.vibe.next_change(), self.vibe.next_keepalive(), self.vibe.next_retry()) if t is not None
+        ]
+        return min(wake_times) if wake_times else None
+
+    async def run(self, get_devices: Callable[[], dict]) -> None:
+        """
+        Render until cancelled.
+
+        Parameters
+        ----------
+        get_devices : Callable[[], dict]
+            Returns the currently connected devices, by device index.
+        """
+        while True:
+            next_render = await self.render(get_devices())
+            timeout = None if next_render is None else max(0.0, next_render - self.clock())
+            try:
+                await asyncio.wait_for(self.vibe.changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
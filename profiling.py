@@ -0,0 +1,212 @@
+"""Profiling mode: CPU and allocation reports per stage of the main loop, without attaching external tools."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+
+class StageStats:
+    """Accumulated cost of one stage."""
+
+    __slots__ = ("calls", "wall", "cpu", "alloc_calls", "peak_alloc", "total_peak_alloc")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.alloc_calls = 0  # calls whose allocations were measured, see Profiler
+        self.peak_alloc = 0  # largest transient allocation of a single call, bytes
+        self.total_peak_alloc = 0  # sum of the per-call transient allocations, a measure of allocation churn
+
+
+class Profiler:
+    """
+    Profiles a whole run with cProfile and tracemalloc, and times the stages wrapped with `wrap` / `wrap_async`.
+
+    cProfile only supports one active profiler, so a single profile covers the run and the stage reports are views of
+    it restricted to the stage functions and their callees. For allocations, each call of a synchronous stage resets
+    the tracemalloc peak, so the per-call peak above the memory in use before the call is the memory the stage
+    allocated transiently. The peak is process-wide, so only the outermost synchronous stage is measured: a stage
+    called from within another one, and async stages (whose awaits let other tasks allocate), report no allocations.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory to write the reports to.
+    trace_frames : int
+        Stack frames tracemalloc keeps per allocation. More frames give better attribution and cost more.
+    top : int
+        Number of entries in each report table.
+    logger : Logger
+        Logger to report dumps to.
+    """
+
+    def __init__(self, output_dir: str, trace_frames: int = 1, top: int = 30, logger=logging):
+        self.output_dir = output_dir
+        self.trace_frames = trace_frames
+        self.top = top
+        self.logger = logger
+        self.stages: dict[str, StageStats] = {}
+        self._stage_functions: dict[str, str] = {}  # stage -> qualified name of the wrapped function
+        self._profile = cProfile.Profile()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_at = time.time()
+        self._sync_depth = 0  # synchronous stages currently running, nested in each other
+        self._running = False
+        self._dumps = 0
+
+    def start(self) -> None:
+        """Start profiling, and dump a report on SIGUSR1 (Ctrl+Break on Windows)."""
+        tracemalloc.start(self.trace_frames)
+        self._baseline = tracemalloc.take_snapshot()
+        self._profile.enable()
+        self._running = True
+        dump_signal = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+        if dump_signal is not None:
+            signal.signal(dump_signal, lambda signum, frame: self.dump())
+            self.logger.info(f"Profiling, send {signal.Signals(dump_signal).name} to write a report")
+
+    def stop(self) -> Optional[str]:
+        """Stop profiling and write the final report."""
+        if not self._running:
+            return None
+        self._running = False
+        self._profile.disable()
+        path = self.dump()
+        tracemalloc.stop()
+        return path
+
+    def _pause(self) -> None:
+        # pstats and dump_stats need the profiler disabled
+        self._profile.disable()
+
+    def _resume(self) -> None:
+        if self._running:
+            self._profile.enable()
+
+    @staticmethod
+    def _enter(measure_alloc: bool) -> tuple[float, float, Optional[int]]:
+        memory_before = None
+        if measure_alloc:
+            memory_before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        return time.perf_counter(), time.process_time(), memory_before
+
+    def _exit(self, stage: str, started: tuple[float, float, Optional[int]]) -> None:
+        wall_start, cpu_start, memory_before = started
+        stats = self.stages.setdefault(stage, StageStats())
+        stats.calls += 1
+        stats.wall += time.perf_counter() - wall_start
+        stats.cpu += time.process_time() - cpu_start
+        if memory_before is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            allocated = max(0, peak - memory_before)
+            stats.alloc_calls += 1
+            stats.peak_alloc = max(stats.peak_alloc, allocated)
+            stats.total_peak_alloc += allocated
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        """Wrap a function so its calls are accounted to `stage`."""
+        self._stage_functions[stage] = function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = self._enter(measure_alloc=self._sync_depth == 0)
+            self._sync_depth += 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._sync_depth -= 1
+                self._exit(stage, started)
+
+        return wrapper
+
+    def wrap_async(self, stage: str, function: Callable) -> Callable:
+        """
+        Wrap a coroutine function so its calls are accounted to `stage`.
+
+        Whatever other tasks do while the coroutine awaits is counted towards the stage too, so the times of async
+        stages are upper bounds, and their allocations are not measured at all.
+        """
+        self._stage_functions[stage] = function.__qualname__
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = self._enter(measure_alloc=False)
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self._exit(stage, started)
+
+        return wrapper
+
+    def report(self) -> str:
+        """Build the text report: stage table, CPU hot spots, per-stage callees and allocation sites."""
+        out = io.StringIO()
+        out.write(f"Profile of {time.time() - self._started_at:.1f}s run\n\n")
+
+        out.write(f"{'stage':<16}{'calls':>10}{'wall ms':>12}{'cpu ms':>12}{'cpu/call us':>14}")
+        out.write(f"{'peak KiB':>12}{'churn KiB/call':>16}\n")
+        for stage, stats in self.stages.items():
+            out.write(
+                f"{stage:<16}{stats.calls:>10}{stats.wall * 1000:>12.1f}{stats.cpu * 1000:>12.1f}"
+                f"{stats.cpu / max(stats.calls, 1) * 1e6:>14.1f}"
+            )
+            if stats.alloc_calls:
+                churn = stats.total_peak_alloc / stats.alloc_calls
+                out.write(f"{stats.peak_alloc / 1024:>12.1f}{churn / 1024:>16.2f}\n")
+            else:
+                # async or only ever nested, see the class docs
+                out.write(f"{'-':>12}{'-':>16}\n")
+
+        self._pause()
+        try:
+            stats = pstats.Stats(self._profile, stream=out)
+        finally:
+            self._resume()
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        out.write("\n=== CPU, whole run ===\n")
+        stats.print_stats(self.top)
+        for stage, qualname in self._stage_functions.items():
+            out.write(f"\n=== CPU, {stage} ({qualname}) ===\n")
+            stats.print_callees(rf"\({qualname.rsplit('.', 1)[-1]}\)$")
+
+        # leave out the profiler's own allocations
+        ignored = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats)]
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignored)
+        out.write("\n=== Memory in use by allocation site ===\n")
+        for statistic in snapshot.statistics("lineno")[: self.top]:
+            out.write(f"{statistic}\n")
+        if self._baseline is not None:
+            out.write("\n=== Memory growth since start ===\n")
+            for statistic in snapshot.compare_to(self._baseline, "lineno")[: self.top]:
+                out.write(f"{statistic}\n")
+        current, _ = tracemalloc.get_traced_memory()
+        out.write(f"\nTraced memory: {current / 1024:.1f} KiB in use\n")
+        return out.getvalue()
+
+    def dump(self) -> str:
+        """Write the report and the raw cProfile data (for e.g. snakeviz), returning the report's path."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._dumps += 1
+        stem = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{self._dumps}")
+        with open(f"{stem}.txt", mode="w", encoding="UTF-8") as f:
+            f.write(self.report())
+        self._pause()
+        try:
+            self._profile.dump_stats(f"{stem}.prof")
+        finally:
+            self._resume()
+        self.logger.info(f"Wrote profile to {stem}.txt")
+        return f"{stem}.txt"
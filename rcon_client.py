@@ -0,0 +1,319 @@
+"""Asyncio client for the Source RCON protocol, so game commands never block the event loop."""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import itertools
+import logging
+import struct
+from typing import Optional
+
+# packet types
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+
+_HEADER = struct.Struct("<iii")  # size, id, type
+
+
+class RCONAuthenticationError(Exception):
+    """The server rejected the RCON password."""
+
+
+def encode_packet(request_id: int, packet_type: int, body: str) -> bytes:
+    """Encode an RCON packet: size, id, type, null terminated body and an empty null terminated string."""
+    payload = body.encode("UTF-8") + b"\x00\x00"
+    return _HEADER.pack(_HEADER.size - 4 + len(payload), request_id, packet_type) + payload
+
+
+async def read_packet(reader: asyncio.StreamReader) -> tuple[int, int, str]:
+    """Read one RCON packet, returning its id, type and body."""
+    (size,) = struct.unpack("<i", await reader.readexactly(4))
+    data = await reader.readexactly(size)
+    request_id, packet_type = struct.unpack_from("<ii", data)
+    return request_id, packet_type, data[8:-2].decode("UTF-8", errors="replace")
+
+
+class _Command:
+    """A queued command, and the response to it as it arrives."""
+
+    __slots__ = ("command", "key", "future", "request_id", "terminator_id", "chunks", "attempts")
+
+    def __init__(self, command: str, key: Optional[str], future: Optional[asyncio.Future]):
+        self.command = command
+        self.key = key
+        self.future = future
+        self.request_id = 0
+        self.terminator_id = 0
+        self.chunks: list[str] = []
+        self.attempts = 0
+
+
+class AsyncRCON:
+    """
+    RCON client holding one persistent, authenticated connection.
+
+    Commands are queued and pipelined: they are written as soon as there is room for them without waiting for the
+    responses to earlier ones. Each command is followed by an empty SERVERDATA_RESPONSE_VALUE packet, which the server
+    mirrors after the (possibly multi-packet) response, so responses can be told apart without waiting. If the
+    connection drops it is re-established in the background and unanswered `submit()` commands are sent again, up to
+    `max_attempts` times in total. `execute()` commands in flight fail right away instead, so their caller can decide.
+
+    Parameters
+    ----------
+    address : tuple[str, int]
+        The server's host and port.
+    password : str
+        The RCON password.
+    timeout : float
+        Timeout for connecting and authenticating, in seconds.
+    command_timeout : float
+        How long `execute()` waits for a response by default, in seconds.
+    max_in_flight : int
+        How many commands may be waiting for a response at once.
+    reconnect_delay : float
+        Delay before the first reconnect attempt, doubled after every failed attempt.
+    max_reconnect_delay : float
+        Longest delay between reconnect attempts.
+    max_attempts : int
+        How many connections a command is tried on before it is given up.
+    logger : Logger
+        Logger to report connection problems to.
+    """
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        password: str,
+        timeout: float = 5.0,
+        command_timeout: float = 5.0,
+        max_in_flight: int = 8,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 30.0,
+        max_attempts: int = 2,
+        logger=logging,
+    ):
+        self.address = address
+        self.password = password
+        self.timeout = timeout
+        self.command_timeout = command_timeout
+        self.max_in_flight = max_in_flight
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_attempts = max_attempts
+        self.logger = logger
+
+        self._ids = itertools.count(1)
+        self._queue: collections.deque[_Command] = collections.deque()
+        self._has_work = asyncio.Event()
+        # request / terminator id -> command waiting for its response
+        self._in_flight: dict[int, _Command] = {}
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # last command sent for each coalescing key
+        self._last_sent: dict[str, str] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether there currently is an authenticated connection."""
+        return self._writer is not None
+
+    async def _connect(self) -> None:
+        """Open a connection and authenticate."""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*self.address), timeout=self.timeout)
+        try:
+            auth_id = next(self._ids)
+            writer.write(encode_packet(auth_id, SERVERDATA_AUTH, self.password))
+            await writer.drain()
+            while True:
+                # the server sends an empty SERVERDATA_RESPONSE_VALUE before the auth response
+                request_id, packet_type, _ = await asyncio.wait_for(read_packet(reader), timeout=self.timeout)
+                if packet_type == SERVERDATA_AUTH_RESPONSE:
+                    break
+            if request_id == -1:
+                raise RCONAuthenticationError("RCON password rejected")
+        except BaseException:
+            writer.close()
+            raise
+        self._reader, self._writer = reader, writer
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+    async def start(self) -> None:
+        """
+        Connect and authenticate, then keep the connection up in the background.
+
+        Raises
+        ------
+        OSError, asyncio.TimeoutError
+            If the server can't be reached.
+        RCONAuthenticationError
+            If the password is rejected.
+        """
+        await self._connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        """Run the connection until it drops, then reconnect, forever."""
+        delay = self.reconnect_delay
+        while True:
+            if self._writer is not None:
+                reader_task = asyncio.create_task(self._read_loop())
+                writer_task = asyncio.create_task(self._write_loop())
+                try:
+                    done, _ = await asyncio.wait((reader_task, writer_task), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    reader_task.cancel()
+                    writer_task.cancel()
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        self.logger.warning(f"RCON connection lost: {task.exception()!r}")
+                self._disconnected()
+                delay = self.reconnect_delay
+
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+                self.logger.info("Reconnected to RCON")
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, RCONAuthenticationError) as e:
+                self.logger.warning(f"RCON reconnect failed ({e!r}), retrying in {delay}s")
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _disconnected(self) -> None:
+        """Drop the connection, fail the `execute()` commands in flight and queue the other unanswered ones again."""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        unanswered = {id(command): command for command in self._in_flight.values()}.values()
+        self._in_flight.clear()
+        for command in sorted(unanswered, key=lambda command: command.request_id, reverse=True):
+            if command.future is not None:
+                # someone is waiting for the response, let them know now rather than after a reconnect
+                if not command.future.done():
+                    command.future.set_exception(ConnectionError(f"RCON connection lost during {command.command!r}"))
+                continue
+            if command.attempts >= self.max_attempts:
+                self.logger.warning(f"Giving up on RCON command {command.command!r}")
+                continue
+            command.chunks.clear()
+            self._queue.appendleft(command)
+        if self._queue:
+            self._has_work.set()
+
+    async def _write_loop(self) -> None:
+        """Write queued commands as long as there is room in flight."""
+        while True:
+            await self._has_work.wait()
+            while self._queue:
+                await self._slots.acquire()
+                if not self._queue:
+                    # the queued command was coalesced away while waiting for room
+                    self._slots.release()
+                    break
+                command = self._queue.popleft()
+                command.request_id = next(self._ids)
+                command.terminator_id = next(self._ids)
+                command.attempts += 1
+                self._in_flight[command.request_id] = command
+                self._in_flight[command.terminator_id] = command
+                if command.key is not None:
+                    self._last_sent[command.key] = command.command
+                self._writer.write(
+                    encode_packet(command.request_id, SERVERDATA_EXECCOMMAND, command.command)
+                    + encode_packet(command.terminator_id, SERVERDATA_RESPONSE_VALUE, "")
+                )
+            self._has_work.clear()
+            await self._writer.drain()
+
+    async def _read_loop(self) -> None:
+        """Collect responses and hand them to the commands waiting for them."""
+        while True:
+            request_id, _, body = await read_packet(self._reader)
+            command = self._in_flight.get(request_id)
+            if command is None:
+                # e.g. the extra packet the server sends after mirroring a terminator
+                continue
+            if request_id == command.request_id:
+                command.chunks.append(body)
+                continue
+            del self._in_flight[command.request_id], self._in_flight[command.terminator_id]
+            self._slots.release()
+            if command.future is not None and not command.future.done():
+                command.future.set_result("".join(command.chunks))
+
+    def submit(self, command: str, key: Optional[str] = None) -> None:
+        """
+        Queue a command without waiting for it.
+
+        Parameters
+        ----------
+        command : str
+            The console command.
+        key : Optional[str]
+            Coalescing key. A queued command with the same key that hasn't been sent yet is replaced, and a command
+            that is the same as the last one sent with its key is dropped, so e.g. quick activate / deactivate toggles
+            don't pile up.
+        """
+        if key is not None:
+            for queued in [queued for queued in self._queue if queued.key == key]:
+                self._queue.remove(queued)
+            if self._last_sent.get(key) == command:
+                return
+        self._queue.append(_Command(command, key, None))
+        self._has_work.set()
+
+    async def execute(self, command: str, timeout: Optional[float] = None) -> str:
+        """
+        Queue a command and wait for its response.
+
+        Parameters
+        ----------
+        command : str
+            The console command.
+        timeout : Optional[float]
+            How long to wait for the response in seconds, `command_timeout` if None.
+
+        Returns
+        -------
+        str
+            The command's console output.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            If there is no response in time, e.g. while the connection is down.
+        ConnectionError
+            If the connection drops while the command is in flight.
+        """
+        queued = _Command(command, None, asyncio.get_running_loop().create_future())
+        self._queue.append(queued)
+        self._has_work.set()
+        try:
+            return await asyncio.wait_for(queued.future, timeout=self.command_timeout if timeout is None else timeout)
+        finally:
+            if queued in self._queue:
+                # timed out (or cancelled) before it was sent, don't send it any more
+                self._queue.remove(queued)
+
+    async def close(self) -> None:
+        """Stop reconnecting, close the connection and fail the commands still waiting for a response."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+        for command in [*self._in_flight.values(), *self._queue]:
+            if command.future is not None and not command.future.done():
+                command.future.set_exception(ConnectionError("RCON client closed"))
+        self._in_flight.clear()
+        self._queue.clear()
@@ -0,0 +1,292 @@
+"""
+Replays a recorded TF2 console.log through the same parsing and vibration logic that main() uses.
+
+RCON and the Intiface devices are replaced by stand-ins that only record what they are sent, so this runs headless,
+either paced like the original session or as fast as possible for benchmarking.
+
+Usage: python replay.py <console.log> --name <player name> [--speed 1.0 | --fast] [--timeline out.csv] [--json]
+"""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from ruamel.yaml import YAML
+
+import event_processor
+import journal
+import latency
+import log_parser
+import log_tailer
+import output_renderer
+import vibration_handler
+
+_TIMESTAMP_PATTERN = re.compile(rb"(\d\d/\d\d/\d\d\d\d - \d\d:\d\d:\d\d): ")
+
+
+class FakeRCON:
+    """Stand-in for rcon_client.AsyncRCON that records every command."""
+
+    def __init__(self, name: str = "unnamed"):
+        self.name = name
+        self.commands: list[str] = []
+
+    def submit(self, command: str, key: Optional[str] = None) -> None:  # pylint: disable=unused-argument
+        """Record the command."""
+        self.commands.append(command)
+
+    async def execute(self, command: str) -> str:
+        """Record the command and answer `name` like the game would."""
+        self.commands.append(command)
+        if command == "name":
+            return f'"name" = "{self.name}" ( def. "unnamed" )'
+        return ""
+
+
+class FakeActuator:
+    """Stand-in for a Buttplug scalar actuator that records the commands it is sent, alone or batched by its device."""
+
+    def __init__(self, device: FakeDevice, index: int, step_count: int = 20):
+        self.device = device
+        self.index = index
+        self.step_count = step_count
+        self.type = "Vibrate"
+        self.description = f"Fake actuator {index}"
+
+    async def command(self, scalar: float) -> None:
+        """Record the command."""
+        self.device.commands.append((self.index, scalar))
+
+
+class FakeDevice:
+    """Stand-in for a Buttplug device with `actuator_count` vibrators."""
+
+    def __init__(self, index: int = 0, actuator_count: int = 1):
+        self.index = index
+        self.name = f"Fake device {index}"
+        self.actuators = tuple(FakeActuator(self, i) for i in range(actuator_count))
+        self.commands: list[tuple[int, float]] = []
+        self.removed = False
+
+    async def send(self, message) -> None:
+        """Record the scalars of a ScalarCmd."""
+        for scalar in message.scalars:
+            self.commands.append((scalar.index, scalar.scalar))
+
+
+class SimulatedClock:
+    """Clock driven by the timestamps of the replayed log, so buzz timers behave as they did in the session."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def line_timestamp(line: bytes, cache: dict[bytes, float]) -> Optional[float]:
+    """
+    Get the con_timestamp time of a log line in seconds since the epoch.
+
+    Parameters
+    ----------
+    line : bytes
+        The log line.
+    cache : dict[bytes, float]
+        Cache of already parsed timestamps; consecutive lines mostly share the same second.
+
+    Returns
+    -------
+    Optional[float]
+        The time of the line, or None if it has no timestamp.
+    """
+    if not (timestamp_match := _TIMESTAMP_PATTERN.match(line)):
+        return None
+    stamp = timestamp_match[1]
+    if (seconds := cache.get(stamp)) is None:
+        seconds = time.mktime(time.strptime(stamp.decode("ascii"), "%m/%d/%Y - %H:%M:%S"))
+        cache[stamp] = seconds
+    return seconds
+
+
+async def replay(
+    lines: list[bytes],
+    name: str,
+    vibe_config: dict,
+    speed: Optional[float],
+    device_count: int = 1,
+    latency_recorder: Optional[latency.LatencyRecorder] = None,
+    journal_dir: Optional[str] = None,
+) -> dict:
+    """
+    Replay log lines through EventProcessor and VibrationHandler.
+
+    Parameters
+    ----------
+    lines : list[bytes]
+        The recorded console.log lines.
+    name : str
+        The name of the player whose kills and deaths trigger vibes.
+    vibe_config : dict
+        The `vibe` section of config.yaml.
+    speed : Optional[float]
+        Playback speed relative to the recording, or None to replay as fast as possible.
+    device_count : int
+        Number of stand-in devices to drive.
+    latency_recorder : Optional[latency.LatencyRecorder]
+        Records the pipeline's stage latencies, if given.
+    journal_dir : Optional[str]
+        Write a session journal of the replay to this directory, timed like the recording, if given.
+
+    Returns
+    -------
+    dict
+        Statistics of the run, including the produced strength timeline as (seconds, strength) pairs.
+    """
+    clock = SimulatedClock()
+    rcon = FakeRCON(name)
+    devices = {i: FakeDevice(i) for i in range(device_count)}
+    session_journal = journal.JournalWriter(journal_dir, clock=clock) if journal_dir is not None else None
+    vibe = vibration_handler.VibrationHandler(
+        logging, rcon, config=vibe_config, clock=clock, latency=latency_recorder, journal=session_journal
+    )
+    renderer = output_renderer.OutputRenderer(
+        vibe,
+        rate=vibe_config.get("output_rate", 20),
+        device_rates=vibe_config.get("device_output_rates", {}),
+        clock=clock,
+    )
+    processor = event_processor.EventProcessor(
+        logging, log_parser.LineClassifier(name), vibe, latency=latency_recorder, journal=session_journal
+    )
+
+    start_time: Optional[float] = None
+    timeline: list[tuple[float, float]] = []
+    timestamp_cache: dict[bytes, float] = {}
+    event_count = 0
+
+    async def advance(to: float) -> None:
+        if speed is not None and to > clock.now:
+            await asyncio.sleep((to - clock.now) / speed)
+        clock.now = to
+
+    next_render: Optional[float] = None
+
+    async def render() -> None:
+        nonlocal next_render
+        next_render = await renderer.render(devices)
+        strength = vibe.current_strength
+        if not timeline or timeline[-1][1] != strength:
+            timeline.append((clock.now - start_time, strength))
+
+    wall_start = time.perf_counter()
+    for line in lines:
+        line_time = line_timestamp(line, timestamp_cache)
+        if line_time is not None:
+            if start_time is None:
+                start_time = clock.now = line_time
+            # run the renders the renderer task would have run before this line was written
+            while next_render is not None and next_render < line_time:
+                await advance(next_render)
+                await render()
+            await advance(line_time)
+
+        detected_at = latency_recorder.now() if latency_recorder is not None else None
+        if processor.handle_line(line, detected_at) is not None:
+            event_count += 1
+            if start_time is not None:
+                await render()
+
+    # let the last buzzes run out
+    while next_render is not None and (vibe.timed_buzzes or vibe.uber_strength):
+        await advance(next_render)
+        await render()
+    wall_time = time.perf_counter() - wall_start
+    if session_journal is not None:
+        session_journal.close()
+
+    return {
+        "lines": len(lines),
+        "events": event_count,
+        "wall_time": wall_time,
+        "lines_per_sec": len(lines) / wall_time if wall_time > 0 else float("inf"),
+        "events_per_sec": event_count / wall_time if wall_time > 0 else float("inf"),
+        "session_length": clock.now - start_time if start_time is not None else 0.0,
+        "device_commands": sum(len(device.commands) for device in devices.values()),
+        "rcon_commands": len(rcon.commands),
+        "timeline": timeline,
+    }
+
+
+def main() -> None:
+    """Replay the recorded console.log given on the command line and print its statistics."""
+    parser = argparse.ArgumentParser(description="Replay a recorded console.log through the event pipeline.")
+    parser.add_argument("logfile", help="recorded console.log (with con_timestamp 1)")
+    parser.add_argument("--name", required=True, help="name of the player to trigger vibes for")
+    parser.add_argument("--config", default="config.yaml", help="config file to take vibe settings from")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed relative to the recording")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible (benchmark)")
+    parser.add_argument("--devices", type=int, default=1, help="number of stand-in devices")
+    parser.add_argument("--timeline", help="write the strength timeline to this CSV file")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show event output while replaying")
+    parser.add_argument("--latency", action="store_true", help="print per-stage latency statistics")
+    parser.add_argument("--journal", help="write a session journal of the replay to this directory")
+    args = parser.parse_args()
+
+    yaml = YAML(typ="safe")
+    with open(Path(args.config), encoding="UTF-8") as f:
+        config = yaml.load(f)
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO if args.verbose else logging.WARNING)
+
+    log = log_tailer.LogTail(args.logfile, start_at_end=False)
+    recorded_lines = log.read_raw_lines()
+    log.close()
+
+    recorder = latency.LatencyRecorder() if args.latency else None
+    with open(os.devnull, mode="w", encoding="UTF-8") as devnull:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            stats = asyncio.run(
+                replay(
+                    recorded_lines,
+                    name=args.name,
+                    vibe_config=config["vibe"],
+                    speed=None if args.fast else args.speed,
+                    device_count=args.devices,
+                    latency_recorder=recorder,
+                    journal_dir=args.journal,
+                )
+            )
+
+    if args.timeline:
+        with open(args.timeline, mode="w", encoding="UTF-8") as f:
+            f.write("seconds,strength\n")
+            for seconds, strength in stats["timeline"]:
+                f.write(f"{seconds:.3f},{strength:.4f}\n")
+
+    if args.json:
+        print(json.dumps({key: value for key, value in stats.items() if key != "timeline"}, indent=2))
+    else:
+        print(f"Replayed {stats['lines']} lines / {stats['events']} events in {stats['wall_time']:.3f}s")
+        print(f"{stats['lines_per_sec']:.0f} lines/sec, {stats['events_per_sec']:.0f} events/sec")
+        print(f"Session length {stats['session_length']:.0f}s, {len(stats['timeline'])} strength changes")
+        print(f"{stats['device_commands']} device commands, {stats['rcon_commands']} RCON commands")
+    if recorder is not None:
+        print(recorder.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Receives a game server's log stream over UDP (Source engine `logaddress_add`) and triggers vibes for many players.
+
+Every log line is classified once, and its kills, deaths and uber deployments are routed to the VibrationHandler of
+each player involved, so a whole server can be followed from one process.
+
+Usage (local testing): python server_log.py <server log> [--to 127.0.0.1:27500 [--speed 1.0 | --fast]] [--secret ..]
+Without --to the log is only classified, to benchmark the parse cost per packet.
+"""
+
+# pylint: disable=logging-fstring-interpolation
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import re
+import socket
+import time
+from typing import NamedTuple, Optional, Union
+
+import log_parser
+import log_tailer
+from latency import LatencyRecorder
+from vibration_handler import VibrationHandler
+
+# logaddress packets: 4 bytes of 0xFF, then "R" and the line, or "S", the sv_logsecret and the line
+_PACKET_HEADER = b"\xff\xff\xff\xff"
+_PLAIN = 0x52  # "R"
+_SECRET = 0x53  # "S"
+
+# "L 10/17/2026 - 21:04:13: " in front of every line
+_LINE_PREFIX = rb"L \d\d/\d\d/\d\d\d\d - \d\d:\d\d:\d\d: "
+# "name<user id><[U:1:steam id]><team>", names are up to 32 characters, i.e. 128 bytes of UTF-8
+_PLAYER = rb'"([^\n]{0,128}?)<\d+><([^>]*)><[^>]*>"'
+
+# cheap substring markers checked before any regex runs
+_KILL_MARKER = b'" killed "'
+_SUICIDE_MARKER = b'" committed suicide with "'
+_CHARGE_MARKER = b'" triggered "charge'
+_ROLE_MARKER = b'" changed role to "'
+
+_KILL_PATTERN = re.compile(_LINE_PREFIX + _PLAYER + rb" killed " + _PLAYER + rb' with "([^"]*)"([^\n]*)')
+_SUICIDE_PATTERN = re.compile(_LINE_PREFIX + _PLAYER + rb" committed suicide")
+_CHARGE_PATTERN = re.compile(_LINE_PREFIX + _PLAYER + rb' triggered "charge(deployed|ended)"')
+_ROLE_PATTERN = re.compile(_LINE_PREFIX + _PLAYER + rb' changed role to "(\w+)"')
+_CRIT_PROPERTY = b'(crit "crit")'
+
+
+class Player(NamedTuple):
+    """A player as named in the server log."""
+
+    name: bytes
+    steam_id: bytes  # e.g. b"[U:1:12345678]", b"BOT" for bots
+
+
+class ServerKill(NamedTuple):
+    """A player killed another player."""
+
+    killer: Player
+    victim: Player
+    weapon: str
+    crit: bool
+
+
+class ServerSuicide(NamedTuple):
+    """A player killed themselves, or was killed by the world."""
+
+    player: Player
+
+
+class ServerCharge(NamedTuple):
+    """A medic deployed an uber (`deployed`) or their uber ran out."""
+
+    player: Player
+    deployed: bool
+
+
+class ServerRoleChange(NamedTuple):
+    """A player switched class."""
+
+    player: Player
+    player_class: log_parser.PlayerClass
+
+
+ServerEvent = Union[ServerKill, ServerSuicide, ServerCharge, ServerRoleChange]
+
+_CLASSES = {player_class.value.encode(): player_class for player_class in log_parser.PlayerClass}
+
+
+def parse_packet(data: bytes, secret: Optional[bytes] = None) -> Optional[bytes]:
+    """
+    Extract the log line from a logaddress packet.
+
+    Parameters
+    ----------
+    data : bytes
+        The UDP payload.
+    secret : Optional[bytes]
+        The server's sv_logsecret, if it sets one. Packets without the right secret are dropped.
+
+    Returns
+    -------
+    Optional[bytes]
+        The log line, starting with "L ", or None if the packet is not a (valid) log packet.
+    """
+    if not data.startswith(_PACKET_HEADER) or len(data) < 5:
+        return None
+    kind = data[4]
+    if kind == _PLAIN and secret is None:
+        body = data[5:]
+    elif kind == _SECRET and secret is not None and data.startswith(secret, 5):
+        body = data[5 + len(secret) :]
+    else:
+        return None
+    return body.rstrip(b"\x00\r\n")
+
+
+def classify(line: bytes) -> Optional[ServerEvent]:
+    """
+    Classify a single server log line.
+
+    Parameters
+    ----------
+    line : bytes
+        The log line, starting with "L ".
+
+    Returns
+    -------
+    Optional[ServerEvent]
+        The parsed event, or None if the line is not interesting.
+    """
+    if _KILL_MARKER in line:
+        if kill_match := _KILL_PATTERN.match(line):
+            return ServerKill(
+                killer=Player(kill_match[1], kill_match[2]),
+                victim=Player(kill_match[3], kill_match[4]),
+                weapon=kill_match[5].decode("ascii", errors="replace"),
+                crit=_CRIT_PROPERTY in kill_match[6],
+            )
+        return None
+
+    if _CHARGE_MARKER in line:
+        if charge_match := _CHARGE_PATTERN.match(line):
+            return ServerCharge(Player(charge_match[1], charge_match[2]), deployed=charge_match[3] == b"deployed")
+        return None
+
+    if _SUICIDE_MARKER in line:
+        if suicide_match := _SUICIDE_PATTERN.match(line):
+            return ServerSuicide(Player(suicide_match[1], suicide_match[2]))
+        return None
+
+    if _ROLE_MARKER in line:
+        if (role_match := _ROLE_PATTERN.match(line)) and (player_class := _CLASSES.get(role_match[3])):
+            return ServerRoleChange(Player(role_match[1], role_match[2]), player_class)
+    return None
+
+
+class ServerLogRouter:
+    """
+    Applies server log events to the vibration handlers of the players involved.
+
+    Parameters
+    ----------
+    logger : Logger
+        Logger to report events to.
+    handlers : dict[str, VibrationHandler]
+        Vibration handler per player, by SteamID3 (e.g. "[U:1:12345678]") or, failing that, by name.
+    latency : Optional[LatencyRecorder]
+        Records how long packets take to be parsed and applied, if given.
+    """
+
+    def __init__(self, logger, handlers: dict[str, VibrationHandler], latency: Optional[LatencyRecorder] = None):
+        self.logger = logger
+        self.handlers: dict[bytes, VibrationHandler] = {key.encode("UTF-8"): vibe for key, vibe in handlers.items()}
+        self.latency = latency
+        self.classes: dict[VibrationHandler, str] = {}  # each player's current class, for the vibe rules
+
+    def handler(self, player: Player) -> Optional[VibrationHandler]:
+        """The vibration handler of a player, or None if they don't have one."""
+        return self.handlers.get(player.steam_id) or self.handlers.get(player.name)
+
+    def handle_line(self, line: bytes, detected_at: Optional[float] = None) -> Optional[ServerEvent]:
+        """
+        Classify a server log line and apply the resulting event.
+
+        Parameters
+        ----------
+        line : bytes
+            The log line.
+        detected_at : Optional[float]
+            When the packet was received (LatencyRecorder.now()), for latency instrumentation.
+
+        Returns
+        -------
+        Optional[ServerEvent]
+            The event the line was classified as, or None.
+        """
+        event = classify(line)
+        if event is None:
+            return None
+        traced = self.latency is not None and detected_at is not None
+        parsed_at = None
+        if traced:
+            parsed_at = self.latency.since("detect_to_parse", detected_at)
+
+        applied: list[VibrationHandler] = []
+        if isinstance(event, ServerKill):
+            if (killer := self.handler(event.killer)) is not None and event.killer != event.victim:
+                self.logger.info(f"Kill logged for {event.killer.name!r}{', crit' if event.crit else ''}")
+                killer.kill(event.crit, self.classes.get(killer), event.weapon)
+                applied.append(killer)
+            if (victim := self.handler(event.victim)) is not None:
+                self.logger.info(f"Death logged for {event.victim.name!r}")
+                victim.death(self.classes.get(victim), event.weapon)
+                applied.append(victim)
+
+        elif isinstance(event, ServerSuicide):
+            if (vibe := self.handler(event.player)) is not None:
+                self.logger.info(f"Death logged for {event.player.name!r}")
+                vibe.death(self.classes.get(vibe))
+                applied.append(vibe)
+
+        elif isinstance(event, ServerCharge):
+            if (vibe := self.handler(event.player)) is not None:
+                if event.deployed:
+                    self.logger.info(f"Uber deployed by {event.player.name!r}")
+                    vibe.start_uber()
+                    applied.append(vibe)
+                elif vibe.uber_strength:
+                    # a medic that died while ubered already had their uber ended by the death
+                    vibe.end_uber()
+                    applied.append(vibe)
+
+        elif isinstance(event, ServerRoleChange):
+            if (vibe := self.handler(event.player)) is not None:
+                self.classes[vibe] = event.player_class.value
+                vibe.killstreak = 0
+                vibe.uberstreak = 0
+
+        if traced and applied:
+            self.latency.trace_applied(detected_at, parsed_at, applied)
+        return event
+
+
+class ServerLogProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram endpoint feeding logaddress packets to a router.
+
+    Parameters
+    ----------
+    router : ServerLogRouter
+        The router to apply the log lines with.
+    secret : Optional[bytes]
+        The server's sv_logsecret, if it sets one.
+    """
+
+    def __init__(self, router: ServerLogRouter, secret: Optional[bytes] = None):
+        self.router = router
+        self.secret = secret
+        self.packets = 0
+        self.dropped = 0
+
+    def datagram_received(self, data: bytes, addr) -> None:  # pylint: disable=unused-argument
+        detected_at = self.router.latency.now() if self.router.latency is not None else None
+        self.packets += 1
+        if (line := parse_packet(data, self.secret)) is None:
+            self.dropped += 1
+            return
+        self.router.handle_line(line, detected_at)
+
+
+async def listen(
+    router: ServerLogRouter, host: str, port: int, secret: Optional[bytes] = None
+) -> tuple[asyncio.DatagramTransport, ServerLogProtocol]:
+    """
+    Receive logaddress packets on a UDP port. Close the returned transport to stop.
+
+    Parameters
+    ----------
+    router : ServerLogRouter
+        The router to apply the log lines with.
+    host : str
+        The address to listen on.
+    port : int
+        The UDP port, as given to `logaddress_add` on the server.
+    secret : Optional[bytes]
+        The server's sv_logsecret, if it sets one.
+
+    Returns
+    -------
+    tuple[asyncio.DatagramTransport, ServerLogProtocol]
+        The transport and the protocol, whose counters tell how many packets arrived.
+    """
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: ServerLogProtocol(router, secret), local_addr=(host, port)
+    )
+    return transport, protocol
+
+
+def encode_packet(line: bytes, secret: Optional[bytes] = None) -> bytes:
+    """Encode a log line as the server would send it to a logaddress."""
+    if secret is None:
+        return _PACKET_HEADER + b"R" + line + b"\n\x00"
+    return _PACKET_HEADER + b"S" + secret + line + b"\n\x00"
+
+
+def main() -> None:
+    """Send the recorded server log given on the command line as logaddress packets, or time classifying them."""
+    import replay  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description="Replay a recorded server log as logaddress packets.")
+    parser.add_argument("logfile", help="recorded server log (the L*.log files in tf/logs)")
+    parser.add_argument("--to", help="host:port to send the packets to, e.g. where main.py --server-log listens")
+    parser.add_argument("--secret", help="sv_logsecret to send the packets with")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed relative to the recording")
+    parser.add_argument("--fast", action="store_true", help="send as fast as possible")
+    args = parser.parse_args()
+
+    log = log_tailer.LogTail(args.logfile, start_at_end=False)
+    recorded_lines = log.read_raw_lines()
+    log.close()
+    packet_secret = args.secret.encode("ascii") if args.secret else None
+    packets = [encode_packet(line, packet_secret) for line in recorded_lines]
+
+    if args.to is None:
+        # parse cost per packet, as the datagram endpoint would see it
+        started = time.perf_counter()
+        event_count = sum(classify(parse_packet(packet, packet_secret)) is not None for packet in packets)
+        elapsed = time.perf_counter() - started
+        print(f"Classified {len(packets)} packets / {event_count} events in {elapsed:.3f}s")
+        print(f"{elapsed / max(len(packets), 1) * 1e6:.2f} us per packet")
+        return
+
+    host, port = args.to.rsplit(":", 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    timestamp_cache: dict[bytes, float] = {}
+    previous: Optional[float] = None
+    for line, packet in zip(recorded_lines, packets):
+        line_time = replay.line_timestamp(line[2:], timestamp_cache)
+        if not args.fast and line_time is not None:
+            if previous is not None and line_time > previous:
+                time.sleep((line_time - previous) / args.speed)
+            previous = line_time
+        sock.sendto(packet, (host, int(port)))
+    sock.close()
+    print(f"Sent {len(packets)} packets to {args.to}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+import config_reload
+from vibration_handler import VibeParams
+
+CONFIG = (Path(__file__).resolve().parent.parent / "config.yaml").read_text(encoding="UTF-8")
+
+
+@pytest.fixture
+def reloader(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(CONFIG, encoding="UTF-8")
+    applied = []
+    reloader = config_reload.ConfigReloader(
+        str(path), lambda config: applied.append(VibeParams.from_config(config["vibe"])), logger=logging
+    )
+    return reloader, path, applied
+
+
+def _edit(path, old, new):
+    text = path.read_text(encoding="UTF-8")
+    assert old in text
+    path.write_text(text.replace(old, new, 1), encoding="UTF-8")
+
+
+def test_valid_edit_is_applied(reloader):
+    reloader, path, applied = reloader
+    _edit(path, "  kill_time:", "  kill_time: 2.5 #")
+    assert reloader.reload()
+    assert applied[-1].rules.lookup("kill").time == 2.5
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        # an empty vibe section
+        ("vibe:\n", "vibe:\nunused:\n"),
+        ("  rules: []", "  rules: [kill]"),
+        ("  envelopes:", "  envelopes: [decay]\n  unused_envelopes:"),
+        ("  rules: []", "  rules: [{event: kill, strength: high}]"),
+    ],
+)
+def test_malformed_edit_is_rejected(reloader, old, new):
+    reloader, path, applied = reloader
+    _edit(path, old, new)
+    assert not reloader.reload()
+    assert not applied
@@ -0,0 +1,32 @@
+import pytest
+
+from event_rules import Rule, RuleTable
+
+DEFAULTS = {"kill": Rule(0.2, 1.0, "hold"), "death": Rule(0.0, 0.0, "hold")}
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"event": "kill", "strength": "high"},
+        {"event": "kill", "strength": True},
+        {"event": "kill", "strength": 1.5},
+        {"event": "kill", "strength": -0.1},
+        {"event": "kill", "time": -5},
+        {"event": "kill", "envelope": ["decay"]},
+        {"event": "kill", "weapon": ["scattergun"]},
+    ],
+)
+def test_invalid_rule_rejects_the_table(rule):
+    with pytest.raises(ValueError):
+        RuleTable([{"event": "death", "strength": 0.5}, rule], DEFAULTS)
+
+
+def test_specific_rule_is_filled_in_from_general_ones():
+    table = RuleTable(
+        [{"event": "kill", "class": "sniper", "time": 2}, {"event": "kill", "weapon": "sniperrifle", "strength": 1}],
+        DEFAULTS,
+    )
+    assert table.lookup("kill", "sniper", "sniperrifle") == Rule(1, 1.0, "hold")
+    assert table.lookup("kill", "sniper", "smg") == Rule(0.2, 2, "hold")
+    assert table.lookup("kill", "scout", "scattergun") == DEFAULTS["kill"]
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+import pytest
+
+from frame_capture import CaptureWorker
+
+
+class FakeBackend:
+    def __init__(self):
+        self.started_continuous = None
+        self.grabs = 0
+        self.grabs_now = 0
+
+    def start(self, region, continuous=True):
+        self.started_continuous = continuous
+
+    def grab(self):
+        time.sleep(0.01)
+        self.grabs += 1
+        return np.full((1, 4, 3), self.grabs, dtype=np.uint8)
+
+    def grab_now(self):
+        self.grabs_now += 1
+        return np.full((1, 4, 3), self.grabs_now, dtype=np.uint8)
+
+    def stop(self):
+        pass
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out")
+        time.sleep(0.005)
+
+
+def test_continuous_capture_keeps_grabbing_without_requests():
+    backend = FakeBackend()
+    worker = CaptureWorker(backend, region=(0, 0, 4, 1), on_demand=False)
+    worker.start()
+    worker.set_active(True)
+    try:
+        _wait_for(lambda: len(worker.recent()) >= 3)
+    finally:
+        worker.stop()
+    assert backend.started_continuous is True
+    assert backend.grabs >= 3 and backend.grabs_now == 0
+
+
+def test_on_demand_capture_grabs_once_per_request():
+    backend = FakeBackend()
+    worker = CaptureWorker(backend, region=(0, 0, 4, 1), on_demand=True)
+    worker.start()
+    worker.set_active(True)
+    try:
+        _wait_for(lambda: backend.started_continuous is not None)
+        time.sleep(0.05)
+        assert worker.latest() == (None, None)
+        worker.request()
+        _wait_for(lambda: worker.latest()[0] is not None)
+    finally:
+        worker.stop()
+    assert backend.started_continuous is False
+    assert (backend.grabs, backend.grabs_now) == (0, 1)
@@ -0,0 +1,30 @@
+import pytest
+
+from log_parser import ClassSwitch, KillEvent, LineClassifier, PlayerClass, SlotSwitch
+
+PREFIX = b"10/17/2026 - 21:04:13: "
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (PREFIX + b"teamfrotress_medic\n", ClassSwitch(PlayerClass.MEDIC)),
+        (PREFIX + b"teamfrotress_slot2\n", SlotSwitch(2)),
+        (PREFIX + b"teamfrotress_nonsense\n", None),
+    ],
+)
+def test_switch_lines(line, expected):
+    assert LineClassifier("me").classify(line) == expected
+
+
+@pytest.mark.parametrize(
+    "line, killer, victim, by_player, of_player",
+    [
+        (PREFIX + b"teamfrotress_medic killed me with scattergun.\n", b"teamfrotress_medic", b"me", False, True),
+        (PREFIX + b"me killed teamfrotress_slot1 with smg. (crit)\n", b"me", b"teamfrotress_slot1", True, False),
+    ],
+)
+def test_kill_with_switch_marker_in_player_name(line, killer, victim, by_player, of_player):
+    event = LineClassifier("me").classify(line)
+    assert isinstance(event, KillEvent)
+    assert (event.killer, event.victim, event.by_player, event.of_player) == (killer, victim, by_player, of_player)
@@ -0,0 +1,39 @@
+import os
+
+from log_tailer import LogTail
+
+
+def _tail(log, checkpoint):
+    return LogTail(str(log), checkpoint_path=str(checkpoint))
+
+
+def test_resumes_from_checkpoint_after_appends(tmp_path):
+    log, checkpoint = tmp_path / "console.log", tmp_path / "checkpoint.json"
+    log.write_bytes(b"old line\n")
+    _tail(log, checkpoint).close()
+    with open(log, "ab") as f:
+        f.write(b"written while away\n")
+
+    tail = _tail(log, checkpoint)
+    assert tail.resumed
+    assert tail.read_raw_lines() == [b"written while away"]
+    tail.close()
+
+
+def test_rejects_checkpoint_after_clear_in_place(tmp_path):
+    log, checkpoint = tmp_path / "console.log", tmp_path / "checkpoint.json"
+    log.write_bytes(b"10/17/2026 - 21:04:13: first session\n")
+    _tail(log, checkpoint).close()
+    inode = os.stat(log).st_ino
+    # -conclearlog truncates in place, and the next session's log soon grows past the old offset
+    with open(log, "r+b") as f:
+        f.truncate(0)
+        f.write(b"10/17/2026 - 22:30:01: second session, much longer line\n10/17/2026 - 22:30:02: midline")
+    assert os.stat(log).st_ino == inode
+
+    tail = _tail(log, checkpoint)
+    assert not tail.resumed
+    with open(log, "ab") as f:
+        f.write(b" rest\n10/17/2026 - 22:30:03: new\n")
+    assert tail.read_raw_lines() == [b"10/17/2026 - 22:30:03: new"]
+    tail.close()
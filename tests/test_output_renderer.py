@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from pathlib import Path
+
+from ruamel.yaml import YAML
+
+from output_renderer import OutputRenderer
+from vibration_handler import VibrationHandler
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.yaml"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class HangingActuator:
+    """Applies every command, except the ones numbered in `hang_on`, which never get an answer."""
+
+    def __init__(self, hang_on):
+        self.index = 0
+        self.hang_on = hang_on
+        self.calls = 0
+        self.value = None
+
+    async def command(self, value):
+        self.calls += 1
+        if self.calls in self.hang_on:
+            await asyncio.sleep(10)
+        self.value = value
+
+
+class Device:
+    def __init__(self, actuator):
+        self.name = "toy"
+        self.index = 0
+        self.actuators = [actuator]
+
+
+def _vibe(clock):
+    vibe_config = YAML(typ="safe").load(CONFIG_PATH.read_text(encoding="UTF-8"))["vibe"]
+    vibe_config.update(device_timeout=0.01, device_retry_interval=0.25, keepalive_interval=0)
+    return VibrationHandler(logging, None, config=vibe_config, clock=clock)
+
+
+def test_lost_stop_command_is_resent():
+    async def run():
+        clock = Clock()
+        vibe = _vibe(clock)
+        renderer = OutputRenderer(vibe, clock=clock)
+        actuator = HangingActuator(hang_on={3})
+        devices = {0: Device(actuator)}
+
+        await renderer.render(devices)
+        vibe.timed_buzz(0.3, clock.now + 1.0)
+        await renderer.render(devices)
+        assert actuator.value == 0.3
+
+        # the buzz ends, and the device never answers the stop command
+        clock.now = 1.5
+        next_render = await renderer.render(devices)
+        assert actuator.value == 0.3 and vibe.current_strength == 0.0
+        assert next_render == 1.5 + 0.25
+
+        clock.now = next_render
+        assert await renderer.render(devices) is None
+        assert (actuator.calls, actuator.value) == (4, 0.0)
+
+    asyncio.run(run())
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+import uber_calibration
+
+HUD_DIR = Path(__file__).resolve().parent.parent / "omphudsexy"
+
+
+def test_1440p_matches_the_old_hardcoded_region():
+    assert uber_calibration.bar_region_from_hud(HUD_DIR, (2560, 1440), inset=0) == (1055, 984, 1505, 1002)
+
+
+def test_1080p_is_the_bar_itself():
+    # the old hardcoded 1080p box (790, 736, 1130, 752) was drawn by hand and took in a pixel or two of the border
+    assert uber_calibration.bar_region_from_hud(HUD_DIR, (1920, 1080), inset=0) == (791, 738, 1128, 751)
+
+
+def test_inset_shrinks_each_side():
+    assert uber_calibration.bar_region_from_hud(HUD_DIR, (1920, 1080)) == (792, 739, 1127, 750)
@@ -0,0 +1,218 @@
+"""Analysis of captured medic uber bar frames."""
+
+from __future__ import annotations
+
+import enum
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+COLOUR_BACKGROUND = (24, 24, 24)
+COLOUR_REGULAR_FILL = (255, 253, 252)
+COLOUR_UBER_MAX_OR_DRAINING = (184, 217, 255)
+
+_CHANNEL_SHIFTS = np.array([16, 8, 0], dtype=np.uint32)
+
+
+class PixelClass(enum.IntEnum):
+    """What a pixel of the uber bar shows."""
+
+    UNKNOWN = 0  # not part of the bar, e.g. the bar is hidden behind a menu
+    BACKGROUND = 1  # empty part of the bar
+    FILL = 2  # charge while building
+    CHARGED = 3  # charge while full or draining
+
+
+DEFAULT_PALETTE: dict[PixelClass, tuple[int, int, int]] = {
+    PixelClass.BACKGROUND: COLOUR_BACKGROUND,
+    PixelClass.FILL: COLOUR_REGULAR_FILL,
+    PixelClass.CHARGED: COLOUR_UBER_MAX_OR_DRAINING,
+}
+
+
+class UberBarReading(NamedTuple):
+    """Result of analysing one uber bar frame."""
+
+    visible: bool
+    state: Optional[str]  # "building", "full" or "draining", None if not visible
+    percentage: float
+
+
+def pack_rgb(frame: np.ndarray) -> np.ndarray:
+    """
+    Pack the RGB channels of a frame into one uint32 per pixel (0x00RRGGBB).
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        The frame, shape (height, width, 3 or 4), RGB(A) channel order.
+
+    Returns
+    -------
+    np.ndarray
+        The packed colours, shape (height, width).
+    """
+    rgb = frame[..., :3].astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+class UberBarAnalyzer:
+    """
+    Classifies uber bar pixels against a palette and works out the bar state in one vectorized pass.
+
+    Parameters
+    ----------
+    palette : dict[PixelClass, tuple[int, int, int]]
+        The reference colour of each pixel class.
+    tolerance : int
+        Maximum per-channel difference from a palette colour for a pixel to still count as that class. This also covers
+        near-identical variants such as the (255, 255, 255) alternate fill colour.
+    """
+
+    def __init__(self, palette: Optional[dict[PixelClass, tuple[int, int, int]]] = None, tolerance: int = 4):
+        self.palette = dict(palette if palette is not None else DEFAULT_PALETTE)
+        self.tolerance = tolerance
+        self._palette_classes = np.array(list(self.palette.keys()), dtype=np.uint8)
+        self._palette_colours = np.array(list(self.palette.values()), dtype=np.int16)
+        # packed colour -> PixelClass of the bar's own colours. Colours that aren't the bar's (menus, spectating) are
+        # never kept, so this holds at most (2 * tolerance + 1) ** 3 colours per palette entry.
+        self._bar_colours: dict[int, int] = {}
+
+    def _classify_colours(self, packed_colours: np.ndarray) -> np.ndarray:
+        """Map distinct packed colours to pixel classes."""
+        colours = packed_colours.tolist()
+        if all(colour in self._bar_colours for colour in colours):
+            return np.array([self._bar_colours[colour] for colour in colours], dtype=np.uint8)
+        rgb = ((packed_colours.astype(np.uint32)[:, None] >> _CHANNEL_SHIFTS) & 0xFF).astype(np.int16)
+        # (colours, palette) max channel difference
+        distance = np.abs(rgb[:, None, :] - self._palette_colours).max(axis=-1)
+        classes = self._palette_classes[distance.argmin(axis=1)]
+        unknown = distance.min(axis=1) > self.tolerance
+        classes[unknown] = PixelClass.UNKNOWN
+        self._bar_colours.update(zip(packed_colours[~unknown].tolist(), classes[~unknown].tolist()))
+        return classes
+
+    def class_counts(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Count the pixels of each class in a frame.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The frame, shape (height, width, 3 or 4), RGB(A) channel order.
+
+        Returns
+        -------
+        np.ndarray
+            Pixel counts indexed by PixelClass.
+        """
+        colours, counts = np.unique(pack_rgb(frame), return_counts=True)
+        return np.bincount(self._classify_colours(colours), weights=counts, minlength=len(PixelClass))
+
+    def analyze(self, frame: np.ndarray) -> UberBarReading:
+        """
+        Work out whether the bar is visible, its state and its fill percentage.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The captured uber bar region, shape (height, width, 3 or 4), RGB(A) channel order.
+
+        Returns
+        -------
+        UberBarReading
+            The bar reading.
+        """
+        if frame.size:
+            # a row through the middle rules out most frames without the bar (menus, spectating) before the whole
+            # frame is looked at
+            middle_row = np.unique(pack_rgb(frame[frame.shape[0] // 2]))
+            if (self._classify_colours(middle_row) == PixelClass.UNKNOWN).any():
+                return UberBarReading(visible=False, state=None, percentage=0.0)
+        counts = self.class_counts(frame)
+        total = counts.sum()
+        if total == 0 or counts[PixelClass.UNKNOWN] > 0:
+            return UberBarReading(visible=False, state=None, percentage=0.0)
+
+        if counts[PixelClass.CHARGED] > 0:
+            # if the charged colour is in the bar, then it's either full or draining
+            percentage = counts[PixelClass.CHARGED] / total * 100
+            state = "full" if counts[PixelClass.CHARGED] == total else "draining"
+        else:
+            percentage = counts[PixelClass.FILL] / total * 100
+            state = "building"
+        return UberBarReading(visible=True, state=state, percentage=float(percentage))
+
+    def classify(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Classify every pixel of a frame.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            The frame, shape (height, width, 3 or 4), RGB(A) channel order.
+
+        Returns
+        -------
+        np.ndarray
+            PixelClass values, shape (height, width).
+        """
+        colours, inverse = np.unique(pack_rgb(frame), return_inverse=True)
+        return self._classify_colours(colours)[inverse].reshape(frame.shape[:2])
+
+    def analyze_scanline(self, frame: np.ndarray) -> UberBarReading:
+        """
+        Work out the bar state from one or a few rows through the bar, by finding where the background starts.
+
+        The fill boundary is averaged over the rows, so the percentage has sub-pixel resolution with several rows.
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            Rows of the uber bar captured with `scanline_region`, shape (rows, width, 3 or 4), RGB(A) channel order.
+
+        Returns
+        -------
+        UberBarReading
+            The bar reading.
+        """
+        classes = self.classify(frame)
+        width = classes.shape[1]
+        if classes.size == 0 or (classes == PixelClass.UNKNOWN).any():
+            return UberBarReading(visible=False, state=None, percentage=0.0)
+
+        background = classes == PixelClass.BACKGROUND
+        # first background pixel of each row, or the full width if the row has none
+        boundaries = np.where(background.any(axis=1), background.argmax(axis=1), width)
+        # the bar fills from the left, so everything right of the boundary must be background
+        if (background.sum(axis=1) != width - boundaries).any():
+            return UberBarReading(visible=False, state=None, percentage=0.0)
+
+        percentage = float(boundaries.mean()) / width * 100
+        if (classes == PixelClass.CHARGED).any():
+            state = "full" if (boundaries == width).all() else "draining"
+        else:
+            state = "building"
+        return UberBarReading(visible=True, state=state, percentage=percentage)
+
+
+def scanline_region(region: tuple[int, int, int, int], rows: int = 1) -> tuple[int, int, int, int]:
+    """
+    Shrink a bar region to `rows` rows through its vertical centre.
+
+    Parameters
+    ----------
+    region : tuple[int, int, int, int]
+        The full uber bar region (left, top, right, bottom).
+    rows : int
+        Number of rows to keep.
+
+    Returns
+    -------
+    tuple[int, int, int, int]
+        The scanline region (left, top, right, bottom).
+    """
+    left, top, right, bottom = region
+    rows = max(1, min(rows, bottom - top))
+    scan_top = top + (bottom - top - rows) // 2
+    return left, scan_top, right, scan_top + rows
@@ -0,0 +1,183 @@
+"""Works out where the uber bar is on screen from the OMPHUD-sexy layout files, for any resolution."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+# Source HUD layouts are authored for a 480 units tall screen and scaled proportionally to the real height
+_HUD_BASE_HEIGHT = 480
+
+_HUD_LAYOUT_FILE = Path("scripts") / "hudlayout.res"
+_MEDIC_CHARGE_FILE = Path("resource") / "ui" / "hudmediccharge.res"
+_HUD_INFO_FILE = Path("info.vdf")
+
+_KEYVALUES_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])|//[^\n]*|\[[^\]]*\]|([^\s{}"]+)')
+
+
+def parse_keyvalues(text: str) -> dict:
+    """
+    Parse a Valve KeyValues (.res / .vdf) document.
+
+    Keys are lowercased, `[$PLATFORM]` conditionals are ignored and later duplicate keys win.
+
+    Parameters
+    ----------
+    text : str
+        The document.
+
+    Returns
+    -------
+    dict
+        Nested dictionaries of the sections, with string values.
+    """
+    root: dict = {}
+    stack = [root]
+    key: Optional[str] = None
+    for match in _KEYVALUES_TOKEN.finditer(text):
+        quoted, brace, bare = match.groups()
+        if brace == "{":
+            section: dict = {}
+            stack[-1][key if key is not None else ""] = section
+            stack.append(section)
+            key = None
+        elif brace == "}":
+            if len(stack) > 1:
+                stack.pop()
+            key = None
+        elif quoted is not None or bare is not None:
+            token = quoted if quoted is not None else bare
+            if key is None:
+                key = token.lower()
+            else:
+                stack[-1][key] = token
+                key = None
+    return root
+
+
+def _find_section(document: dict, name: str) -> dict:
+    """Find a section by (lowercase) name one level below the document's root section."""
+    for root_section in document.values():
+        if isinstance(root_section, dict) and isinstance(root_section.get(name), dict):
+            return root_section[name]
+    raise KeyError(f"HUD layout has no {name} section")
+
+
+def _scaled(value: float, scale: float) -> int:
+    # vgui truncates every proportionally scaled value to an int
+    return int(value * scale)
+
+
+def _position(value: str, parent_size: int, scale: float) -> int:
+    """Resolve an xpos / ypos value (`10`, `c-100`, `r20`) relative to the parent's size."""
+    value = value.strip()
+    if value.startswith("c"):
+        return parent_size // 2 + _scaled(float(value[1:] or 0), scale)
+    if value.startswith("r"):
+        return parent_size - _scaled(float(value[1:] or 0), scale)
+    return _scaled(float(value), scale)
+
+
+def _get(section: dict, key: str, minmode: bool) -> str:
+    if minmode and f"{key}_minmode" in section:
+        return section[f"{key}_minmode"]
+    return section[key]
+
+
+def bar_region_from_hud(
+    hud_dir: str | Path, resolution: tuple[int, int], minmode: bool = False, inset: int = 1
+) -> tuple[int, int, int, int]:
+    """
+    Derive the uber bar region from the HUD's layout files.
+
+    Parameters
+    ----------
+    hud_dir : str | Path
+        The HUD folder (containing scripts/hudlayout.res and resource/ui/hudmediccharge.res).
+    resolution : tuple[int, int]
+        The game resolution (width, height).
+    minmode : bool
+        Whether the HUD runs with cl_hud_minmode 1.
+    inset : int
+        Pixels to shrink the region by on each side, so anti-aliased bar edges are never captured.
+
+    Returns
+    -------
+    tuple[int, int, int, int]
+        The uber bar region (left, top, right, bottom).
+    """
+    hud_dir = Path(hud_dir)
+    width, height = resolution
+    scale = height / _HUD_BASE_HEIGHT
+
+    layout = parse_keyvalues((hud_dir / _HUD_LAYOUT_FILE).read_text(encoding="UTF-8", errors="replace"))
+    panel = _find_section(layout, "hudmediccharge")
+    charge = parse_keyvalues((hud_dir / _MEDIC_CHARGE_FILE).read_text(encoding="UTF-8", errors="replace"))
+    meter = _find_section(charge, "chargemeter")
+
+    panel_x = _position(_get(panel, "xpos", minmode), width, scale)
+    panel_y = _position(_get(panel, "ypos", minmode), height, scale)
+    panel_wide = _scaled(float(_get(panel, "wide", minmode)), scale)
+    panel_tall = _scaled(float(_get(panel, "tall", minmode)), scale)
+
+    left = panel_x + _position(_get(meter, "xpos", minmode), panel_wide, scale)
+    top = panel_y + _position(_get(meter, "ypos", minmode), panel_tall, scale)
+    right = left + _scaled(float(_get(meter, "wide", minmode)), scale)
+    bottom = top + _scaled(float(_get(meter, "tall", minmode)), scale)
+
+    return left + inset, top + inset, right - inset, bottom - inset
+
+
+def hud_version(hud_dir: str | Path) -> str:
+    """A short hash of the HUD files the bar region depends on, to invalidate cached calibrations."""
+    digest = hashlib.sha1()
+    for relative in (_HUD_INFO_FILE, _HUD_LAYOUT_FILE, _MEDIC_CHARGE_FILE):
+        path = Path(hud_dir) / relative
+        if path.is_file():
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def calibrate(
+    hud_dir: str | Path, resolution: tuple[int, int], cache_path: Optional[str] = None, minmode: bool = False
+) -> tuple[int, int, int, int]:
+    """
+    Get the uber bar region for a resolution, from the calibration cache if possible.
+
+    Parameters
+    ----------
+    hud_dir : str | Path
+        The HUD folder.
+    resolution : tuple[int, int]
+        The game resolution (width, height).
+    cache_path : Optional[str]
+        JSON file to cache calibrations in, keyed by resolution, minmode and HUD version.
+    minmode : bool
+        Whether the HUD runs with cl_hud_minmode 1.
+
+    Returns
+    -------
+    tuple[int, int, int, int]
+        The uber bar region (left, top, right, bottom).
+    """
+    key = f"{resolution[0]}x{resolution[1]}:{'minmode' if minmode else 'full'}:{hud_version(hud_dir)}"
+    cache: dict = {}
+    if cache_path is not None and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, mode="r", encoding="UTF-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        if key in cache:
+            return tuple(cache[key])
+
+    region = bar_region_from_hud(hud_dir, resolution, minmode=minmode)
+    if cache_path is not None:
+        cache[key] = list(region)
+        with open(cache_path, mode="w", encoding="UTF-8") as f:
+            json.dump(cache, f, indent=2)
+    return region
@@ -0,0 +1,142 @@
+"""Predicts uber charge between captures, so the bar is only captured when something is about to happen."""
+
+from __future__ import annotations
+
+import collections
+from typing import Optional
+
+# A full uber drains in 8 seconds
+DRAIN_RATE = 100 / 8  # percent per second
+# threshold main() uses to decide that an uber has ended
+UBER_END_PERCENTAGE = 5
+
+
+class UberEstimator:
+    """
+    Models uber charge over time from recent bar readings and schedules the next capture.
+
+    Build rate is fitted from the recent samples (it changes with healing and overheal), drain rate is fixed. Captures
+    are scheduled densely shortly before a predicted milestone crossing, the bar filling up, or the end of a drain, and
+    sparsely otherwise. While the bar is full, deploying can happen at any moment, so it is polled at `full_interval`.
+
+    Parameters
+    ----------
+    milestones : list[int]
+        The uber milestones (percentages) that trigger vibes.
+    dense_interval : float
+        Capture interval in seconds close to a predicted event.
+    sparse_interval : float
+        Longest capture interval in seconds, which bounds how late a change in build rate is noticed.
+    full_interval : float
+        Capture interval in seconds while the bar is full.
+    lead_time : float
+        How long before a predicted event to switch to dense captures, in seconds.
+    window : float
+        How many seconds of samples to fit the build rate on.
+    """
+
+    def __init__(
+        self,
+        milestones: list[int],
+        dense_interval: float = 0.05,
+        sparse_interval: float = 1.0,
+        full_interval: float = 0.1,
+        lead_time: float = 0.3,
+        window: float = 3.0,
+    ):
+        self.milestones = sorted(milestones)
+        self.dense_interval = dense_interval
+        self.sparse_interval = sparse_interval
+        self.full_interval = full_interval
+        self.lead_time = lead_time
+        self.window = window
+        self._samples: collections.deque[tuple[float, float]] = collections.deque()
+        self.state: Optional[str] = None
+
+    def reset(self) -> None:
+        """Forget all samples, e.g. after dying, a class switch or while the bar was hidden."""
+        self._samples.clear()
+        self.state = None
+
+    def add_sample(self, t: float, percentage: float, state: str) -> None:
+        """
+        Add a bar reading.
+
+        Parameters
+        ----------
+        t : float
+            Capture time (time.monotonic()).
+        percentage : float
+            The bar percentage.
+        state : str
+            "building", "full" or "draining".
+        """
+        if state != self.state or (self._samples and state == "building" and percentage < self._samples[-1][1]):
+            # state change, or charge lost (death / respawn), older samples no longer describe the bar
+            self._samples.clear()
+        self.state = state
+        self._samples.append((t, percentage))
+        while self._samples and self._samples[0][0] < t - self.window:
+            self._samples.popleft()
+
+    def rate(self) -> Optional[float]:
+        """The current rate of change in percent per second, or None if not known yet."""
+        if self.state == "draining":
+            return -DRAIN_RATE
+        if self.state == "full":
+            return 0.0
+        if len(self._samples) < 2:
+            return None
+        # least squares slope
+        n = len(self._samples)
+        mean_t = sum(t for t, _ in self._samples) / n
+        mean_p = sum(p for _, p in self._samples) / n
+        var_t = sum((t - mean_t) ** 2 for t, _ in self._samples)
+        if var_t == 0:
+            return None
+        return sum((t - mean_t) * (p - mean_p) for t, p in self._samples) / var_t
+
+    def predict(self, t: float) -> Optional[float]:
+        """Predicted bar percentage at time `t`, or None without samples."""
+        if not self._samples:
+            return None
+        last_t, last_p = self._samples[-1]
+        rate = self.rate() or 0.0
+        return min(100.0, max(0.0, last_p + rate * (t - last_t)))
+
+    def time_to_next_event(self, t: float) -> Optional[float]:
+        """Seconds from `t` until the next predicted milestone crossing, full bar or end of drain."""
+        percentage = self.predict(t)
+        rate = self.rate()
+        if percentage is None or rate is None:
+            return None
+        if rate > 0 and percentage < 100:
+            targets = [m for m in self.milestones if m > percentage] + [100]
+            return (min(targets) - percentage) / rate
+        if rate < 0 and percentage >= UBER_END_PERCENTAGE:
+            return (percentage - UBER_END_PERCENTAGE) / -rate
+        return None
+
+    def next_capture_time(self, t: float) -> float:
+        """
+        When to capture the bar next.
+
+        Parameters
+        ----------
+        t : float
+            Time of the last capture (time.monotonic()).
+
+        Returns
+        -------
+        float
+            The time (time.monotonic()) of the next capture.
+        """
+        if self.state == "full":
+            return t + self.full_interval
+        time_to_event = self.time_to_next_event(t)
+        if time_to_event is None:
+            # no rate yet (need a second sample) or not building; a second sample soon gives a rate
+            return t + (self.dense_interval if len(self._samples) < 2 else self.sparse_interval)
+        if time_to_event <= self.lead_time:
+            return t + self.dense_interval
+        return t + min(self.sparse_interval, max(self.dense_interval, time_to_event - self.lead_time))
@@ -1,49 +1,216 @@
 """Scripts for handling the reward vibration strength and buzzes."""
 
+from __future__ import annotations
+
+import asyncio
+import heapq
+import math
 import time
+from typing import NamedTuple, Optional
+
+from buttplug.messages import v3
+
+from event_rules import Rule, RuleTable
+from journal import JournalWriter
+from latency import LatencyRecorder
+
+# Envelopes shape a buzz's strength over its duration. They are sampled once into tables, so evaluating one while
+# rendering is a lookup instead of a function call.
+ENVELOPE_SAMPLES = 256
+ENVELOPES: dict[str, tuple[float, ...]] = {
+    # full strength for the whole buzz
+    "hold": (1.0,) * ENVELOPE_SAMPLES,
+    # rises from nothing to full strength
+    "ramp": tuple((i + 1) / ENVELOPE_SAMPLES for i in range(ENVELOPE_SAMPLES)),
+    # starts at full strength and fades out
+    "decay": tuple(math.exp(-4 * i / ENVELOPE_SAMPLES) for i in range(ENVELOPE_SAMPLES)),
+    # four smooth pulses
+    "pulse": tuple(math.sin(4 * math.pi * i / ENVELOPE_SAMPLES) ** 2 for i in range(ENVELOPE_SAMPLES)),
+}
+
+
+def envelope_value(envelope: str, progress: float) -> float:
+    """The value of an envelope at `progress` (0 to 1) through it."""
+    table = ENVELOPES[envelope]
+    return table[min(len(table) - 1, max(0, int(progress * len(table))))]
+
+
+def _number(config: dict, key: str, minimum: Optional[float] = 0.0, default: Optional[float] = None) -> float:
+    """Read a numeric setting, raising ValueError if it is missing, not a number or below `minimum`."""
+    value = config.get(key, default)
+    if value is None:
+        raise ValueError(f"Missing vibe setting {key}")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Vibe setting {key} must be a number, not {value!r}")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"Vibe setting {key} must be at least {minimum}, not {value!r}")
+    return value
+
+
+class VibeParams(NamedTuple):
+    """
+    The `vibe` settings, validated and with the values derived from them precomputed.
+
+    Immutable, so a new set can be swapped in as a whole (see VibrationHandler.set_params) without an event ever seeing
+    a mix of old and new settings.
+    """
+
+    activate_command: str
+    deactivate_command: str
+    base_vibe: float
+    # kills and deaths, per class and weapon, with the kill_* / death_* settings as the defaults
+    rules: RuleTable
+    kill_crit_strength_multiplier: float
+    kill_crit_time_multiplier: float
+    killstreak_max: int
+    # strength / time factor for each killstreak from 0 to killstreak_max
+    killstreak_strength_factors: tuple[float, ...]
+    killstreak_time_factors: tuple[float, ...]
+    uber_active_strength: float
+    uber_streak_multiplier: float
+    # (milestone percentage, strength, time) of each milestone buzz
+    uber_milestone_buzzes: tuple[tuple[float, float, float], ...]
+    uber_milestone_envelope: str
+    uber_envelope: str
+    # the uber buzz lasts until the uber ends, so its envelope repeats with this period (seconds)
+    uber_envelope_period: float
+    # resend an unchanged non-zero strength after this many seconds, for devices that stop on their own; 0 disables
+    keepalive_interval: float
+    # how long a device gets to accept a command before it is skipped for this update
+    device_timeout: float
+    # how soon a command that failed or timed out is sent again (seconds)
+    device_retry_interval: float
+
+    @classmethod
+    def from_config(cls, config: dict) -> VibeParams:
+        """
+        Validate the `vibe` section of config.yaml and build the parameters from it.
+
+        Raises
+        ------
+        ValueError
+            If a setting is missing or invalid.
+        """
+        if not isinstance(config, dict):
+            raise ValueError(f"The vibe section must be a mapping of settings, not {config!r}")
+        for key in ("activate_command", "deactivate_command"):
+            if not isinstance(config.get(key), str):
+                raise ValueError(f"Vibe setting {key} must be a string (\"\" for none)")
+
+        # Envelopes (see ENVELOPES) for each kind of buzz, "hold" keeps a constant strength
+        envelopes = config.get("envelopes") or {}
+        if not isinstance(envelopes, dict):
+            raise ValueError(f"Vibe setting envelopes must map buzz kinds to envelopes, not {envelopes!r}")
+        rule_list = config.get("rules") or []
+        if not isinstance(rule_list, list) or not all(isinstance(rule, dict) for rule in rule_list):
+            raise ValueError(f"Vibe setting rules must be a list of rules, each a mapping, not {rule_list!r}")
+        rules = RuleTable(
+            rule_list,
+            defaults={
+                "kill": Rule(
+                    _number(config, "kill_strength"), _number(config, "kill_time"), envelopes.get("kill", "hold")
+                ),
+                "death": Rule(
+                    _number(config, "death_strength"), _number(config, "death_time"), envelopes.get("death", "hold")
+                ),
+            },
+        )
+        uber_milestone_envelope = envelopes.get("uber_milestone", "hold")
+        uber_envelope = envelopes.get("uber", "hold")
+        envelopes_used = {uber_milestone_envelope, uber_envelope}
+        envelopes_used.update(rule.envelope for rule in rules.table.values())
+        for envelope in envelopes_used:
+            if envelope not in ENVELOPES:
+                raise ValueError(f"Unknown envelope {envelope!r}, expected one of {', '.join(ENVELOPES)}")
+
+        killstreak_max = _number(config, "killstreak_max", minimum=1)
+        if not isinstance(killstreak_max, int):
+            raise ValueError(f"Vibe setting killstreak_max must be a whole number, not {killstreak_max!r}")
+        strength_multiplier = _number(config, "killstreak_strength_multiplier")
+        time_multiplier = _number(config, "killstreak_time_multiplier")
+        # [0, 1]
+        killstreak_coeffs = [streak / killstreak_max for streak in range(killstreak_max + 1)]
+
+        milestones = config.get("uber_milestones") or []
+        if not isinstance(milestones, list) or not all(
+            isinstance(x, (int, float)) and not isinstance(x, bool) for x in milestones
+        ):
+            raise ValueError(f"Vibe setting uber_milestones must be a list of percentages, not {milestones!r}")
+        milestone_strength = _number(config, "uber_milestone_strength")
+        milestone_time = _number(config, "uber_milestone_time")
+        milestone_strength_multiplier = _number(config, "uber_milestone_strength_multiplier")
+        milestone_time_multiplier = _number(config, "uber_milestone_time_multiplier")
+        milestone_buzzes = []
+        for i, x in enumerate(milestones):
+            uber_milestone_coeff = i / len(milestones) - 1
+            milestone_buzzes.append(
+                (
+                    x,
+                    milestone_strength * (uber_milestone_coeff * (milestone_strength_multiplier - 1.0) + 1.0),
+                    milestone_time * (uber_milestone_coeff * (milestone_time_multiplier - 1.0) + 1.0),
+                )
+            )
+
+        return cls(
+            activate_command=config["activate_command"],
+            deactivate_command=config["deactivate_command"],
+            base_vibe=_number(config, "base_vibe"),
+            rules=rules,
+            kill_crit_strength_multiplier=_number(config, "kill_crit_strength_multiplier"),
+            kill_crit_time_multiplier=_number(config, "kill_crit_time_multiplier"),
+            killstreak_max=killstreak_max,
+            killstreak_strength_factors=tuple(c * (strength_multiplier - 1.0) + 1.0 for c in killstreak_coeffs),
+            killstreak_time_factors=tuple(c * (time_multiplier - 1.0) + 1.0 for c in killstreak_coeffs),
+            uber_active_strength=_number(config, "uber_active_strength"),
+            uber_streak_multiplier=_number(config, "uber_streak_multiplier"),
+            uber_milestone_buzzes=tuple(milestone_buzzes),
+            uber_milestone_envelope=uber_milestone_envelope,
+            uber_envelope=uber_envelope,
+            uber_envelope_period=_number(config, "uber_envelope_period", minimum=1e-3, default=1.0),
+            keepalive_interval=_number(config, "keepalive_interval", default=0),
+            device_timeout=_number(config, "device_timeout", minimum=1e-3, default=0.5),
+            device_retry_interval=_number(config, "device_retry_interval", minimum=1e-3, default=0.25),
+        )
 
 
 class VibrationHandler:
     """Handles the reward vibration strength and buzzes."""
 
-    def __init__(self, logger, rcon, config: dict):
+    def __init__(
+        self,
+        logger,
+        rcon,
+        config: dict,
+        clock=time.monotonic,
+        latency: Optional[LatencyRecorder] = None,
+        journal: Optional[JournalWriter] = None,
+    ):
         self.logger = logger
         self.rcon = rcon
+        self.clock = clock  # time source for buzz timers, replaced by a simulated clock when replaying logs
+        self.latency = latency  # records how long applied events take to reach the devices, if set
+        self.journal = journal  # records uber state and strength changes in the session journal, if set
+        # (detected_at, applied_at) of the last event applied, until it is sent to the devices
+        self.trace: Optional[tuple[float, float]] = None
         self.uber_strength = 0  # uber active strength
-        # Timed buzzes are a list of tuples of (strength, time_end)
-        self.timed_buzzes: list[tuple[float, float]] = []  # list of timed vibration activations
+        self.uber_start = 0.0  # when the current uber started, for its envelope
+        self.uber_active = False  # whether an uber is running, even one set to vibrate at 0
+        # Timed buzzes are a max-heap of (-strength, -time_end, time_start, envelope), so the strongest (and among
+        # equals the longest) buzz is on top. Expired buzzes are only dropped once they reach the top.
+        self.timed_buzzes: list[tuple[float, float, float, str]] = []  # heap of timed vibration activations
+        # set whenever a buzz or uber starts or ends, to wake up the output renderer
+        self.changed = asyncio.Event()
         self._curr_strength = 0  # current strength priv variable
         self.last_strength = 0
         self.killstreak = 0  # killstreak tracking
         self.uberstreak = 0
 
-        # Set config args
-        self.activate_command: str = config["activate_command"]
-        self.deactivate_command: str = config["deactivate_command"]
-        self.base_vibe: float = config["base_vibe"]
-        # Kills
-        self.kill_strength: float = config["kill_strength"]
-        self.kill_time: float = config["kill_time"]
-        self.kill_crit_strength_multiplier: float = config["kill_crit_strength_multiplier"]
-        self.kill_crit_time_multiplier: float = config["kill_crit_time_multiplier"]
-
-        # Killstreaks
-        self.killstreak_strength_multiplier: float = config["killstreak_strength_multiplier"]
-        self.killstreak_time_multiplier: float = config["killstreak_time_multiplier"]
-        self.killstreak_max: int = config["killstreak_max"]
-
-        # Death
-        self.death_strength: float = config["death_strength"]
-        self.death_time: float = config["death_time"]
-
-        # Uber
-        self.uber_active_strength: float = config["uber_active_strength"]
-        self.uber_streak_multiplier: float = config["uber_streak_multiplier"]
-        self.uber_milestones: list[int] = config["uber_milestones"]
-        self.uber_milestone_strength: float = config["uber_milestone_strength"]
-        self.uber_milestone_time: float = config["uber_milestone_time"]
-        self.uber_milestone_strength_multiplier: float = config["uber_milestone_strength_multiplier"]
-        self.uber_milestone_time_multiplier: float = config["uber_milestone_time_multiplier"]
+        # all settings, validated and with derived values precomputed; swapped as a whole by set_params()
+        self.params = VibeParams.from_config(config)
+        # (device index, actuator index) -> (last sent value, time sent)
+        self.sent: dict[tuple[int, int], tuple[float, float]] = {}
+        # (device index, actuator index) -> when its last command failed, until a command to it goes through
+        self.unconfirmed: dict[tuple[int, int], float] = {}
 
     @property
     def current_strength(self):
@@ -55,100 +222,241 @@ class VibrationHandler:
         if new_strength > self._curr_strength:
             self._curr_strength = new_strength
 
-    def timed_buzz(self, strength, time_end):
+    def set_params(self, params: VibeParams) -> None:
+        """Swap in new settings. Streaks, running buzzes and the uber carry on, and are re-rendered with them."""
+        self.params = params
+        self.changed.set()
+
+    def timed_buzz(self, strength, time_end, envelope="hold"):
         """Add a timed buzz to the queue."""
-        self.timed_buzzes.append((strength, time.time() + time_end))
+        now = self.clock()
+        heapq.heappush(self.timed_buzzes, (-strength, -(now + time_end), now, envelope))
+        self.changed.set()
+
+    def _expire_buzzes(self, now: float) -> None:
+        """Drop expired buzzes off the top of the heap, so the top is the strongest running buzz."""
+        while self.timed_buzzes and -self.timed_buzzes[0][1] <= now:
+            heapq.heappop(self.timed_buzzes)
+
+    def buzz_strength(self, now: Optional[float] = None) -> float:
+        """The strength of the strongest running timed buzz at `now`, with its envelope applied."""
+        now = self.clock() if now is None else now
+        self._expire_buzzes(now)
+        if not self.timed_buzzes:
+            return 0
+        if self.timed_buzzes[0][3] == "hold":
+            # nothing below the top can be stronger than its constant strength
+            return -self.timed_buzzes[0][0]
+        strength = 0
+        for neg_strength, neg_end, start, envelope in self.timed_buzzes:
+            if now < -neg_end:
+                strength = max(strength, -neg_strength * envelope_value(envelope, (now - start) / (-neg_end - start)))
+        return strength
 
-    def death(self):
-        """On death, trigger a reward ;3 based on the current streak."""
+    def strength_at(self, now: float) -> float:
+        """The total vibration strength at `now`: the strongest of the base vibe, the running buzzes and the uber."""
+        params = self.params
+        uber_strength = self.uber_strength
+        if uber_strength and params.uber_envelope != "hold":
+            progress = ((now - self.uber_start) / params.uber_envelope_period) % 1.0
+            uber_strength *= envelope_value(params.uber_envelope, progress)
+        return max(params.base_vibe, self.buzz_strength(now), uber_strength)
+
+    @property
+    def animating(self) -> bool:
+        """Whether the strength is currently changing continuously, i.e. an envelope other than "hold" is running."""
+        now = self.clock()
+        if self.uber_strength and self.params.uber_envelope != "hold":
+            return True
+        return any(envelope != "hold" and now < -neg_end for _, neg_end, _, envelope in self.timed_buzzes)
+
+    def next_change(self) -> Optional[float]:
+        """
+        When the strength will next change on its own, i.e. when the strongest running buzz ends.
+
+        Envelopes are not taken into account, see `animating`.
+
+        Returns
+        -------
+        Optional[float]
+            The time (in `clock` time) of the next change, or None if no timed buzz is running.
+        """
+        self._expire_buzzes(self.clock())
+        return -self.timed_buzzes[0][1] if self.timed_buzzes else None
+
+    def death(self, player_class: Optional[str] = None, weapon: Optional[str] = None):
+        """On death, trigger a reward ;3 based on the current streak, our class and the killer's weapon."""
         self.killstreak = 0
         self.end_uber_death()
-        self.timed_buzz(self.death_strength, self.death_time)
+        rule = self.params.rules.lookup("death", player_class, weapon)
+        self.timed_buzz(rule.strength, rule.time, rule.envelope)
 
-    def kill(self, crit=False):
-        """On kill, trigger reward based on current streak."""
+    def kill(self, crit=False, player_class: Optional[str] = None, weapon: Optional[str] = None):
+        """On kill, trigger reward based on current streak, our class and the weapon."""
         self.killstreak += 1
-        # [0, 1]
-        killstreak_coeff = min(self.killstreak, self.killstreak_max) / (self.killstreak_max)
+        params = self.params
+        streak = min(self.killstreak, params.killstreak_max)
+        rule = params.rules.lookup("kill", player_class, weapon)
 
         strength = (
-            self.kill_strength
-            * (killstreak_coeff * (self.killstreak_strength_multiplier - 1.0) + 1.0)
-            * (self.kill_crit_strength_multiplier if crit else 1.0)
+            rule.strength
+            * params.killstreak_strength_factors[streak]
+            * (params.kill_crit_strength_multiplier if crit else 1.0)
         )
         kill_time = (
-            self.kill_time
-            * (killstreak_coeff * (self.killstreak_time_multiplier - 1.0) + 1.0)
-            * (self.kill_crit_time_multiplier if crit else 1.0)
+            rule.time * params.killstreak_time_factors[streak] * (params.kill_crit_time_multiplier if crit else 1.0)
         )
 
-        self.timed_buzz(strength, kill_time)
+        self.timed_buzz(strength, kill_time, rule.envelope)
 
     def uber_milestone(self, uber_percent, last_uber_percent):
         """Check if we hit an uber milestone and reward accordingly."""
-        for i, x in enumerate(self.uber_milestones):
+        for x, strength, milestone_time in self.params.uber_milestone_buzzes:
             if uber_percent > x >= last_uber_percent:
                 self.logger.info(f"Hit Uber milestone {x}")
-                uber_milestone_coeff = i / len(self.uber_milestones) - 1
-                self.timed_buzz(
-                    self.uber_milestone_strength
-                    * (uber_milestone_coeff * (self.uber_milestone_strength_multiplier - 1.0) + 1.0),
-                    self.uber_milestone_time
-                    * (uber_milestone_coeff * (self.uber_milestone_time_multiplier - 1.0) + 1.0),
-                )
+                self.timed_buzz(strength, milestone_time, self.params.uber_milestone_envelope)
 
     def start_uber(self):
         """On start of uber, set strength based on the current streak."""
-        self.uber_strength = self.uber_active_strength * (self.uber_streak_multiplier**self.uberstreak)
+        self.uber_strength = self.params.uber_active_strength * (self.params.uber_streak_multiplier**self.uberstreak)
+        self.uber_start = self.clock()
+        self.uber_active = True
+        if self.journal is not None:
+            self.journal.uber(True)
+        self.changed.set()
 
     def end_uber(self):
         """On end of uber, reset the strength and increment the streak."""
+        if self.journal is not None and self.uber_active:
+            self.journal.uber(False)
+        self.uber_active = False
         self.uber_strength = 0
         self.uberstreak += 1
+        self.changed.set()
 
     def end_uber_death(self):
         """On death, reset the uber strength and streak."""
+        if self.journal is not None and self.uber_active:
+            self.journal.uber(False, died=True)
+        self.uber_active = False
         self.uber_strength = 0
         self.uberstreak = 0
+        self.changed.set()
 
     def update(self):
         """Update the current strength based on the timed buzzes and the base vibe."""
         self.last_strength = self.current_strength
-        self._curr_strength = self.base_vibe
-
-        now = time.time()
-
-        for timer in self.timed_buzzes:
-            if now <= timer[1]:
-                self.current_strength = timer[0]
-
-        self.current_strength = self.uber_strength
-
-        self.timed_buzzes = list(filter(lambda x: x[1] > now, self.timed_buzzes))
+        self._curr_strength = self.strength_at(self.clock())
+        if self.journal is not None:
+            self.journal.strength(self._curr_strength)
 
         # Check if we need to run the activate/deactivate command
-        if self.current_strength > self.base_vibe >= self.last_strength:
-            if self.activate_command != "":
+        params = self.params
+        if self.current_strength > params.base_vibe >= self.last_strength:
+            if params.activate_command != "":
                 self.logger.info("Running activate command")
-                self.rcon.execute(self.activate_command)
-        if self.current_strength <= self.base_vibe < self.last_strength:
-            if self.deactivate_command != "":
+                # queued, so the game's feedback never delays the device output
+                self.rcon.submit(params.activate_command, key="vibe_toggle")
+        if self.current_strength <= params.base_vibe < self.last_strength:
+            if params.deactivate_command != "":
                 self.logger.info("Running deactivate command")
-                self.rcon.execute(self.deactivate_command)
+                self.rcon.submit(params.deactivate_command, key="vibe_toggle")
 
         return self.current_strength
 
+    def next_keepalive(self) -> Optional[float]:
+        """When the next keep-alive resend is due, or None if keep-alives are off or nothing is vibrating."""
+        if self.params.keepalive_interval <= 0:
+            return None
+        running = [sent_at for value, sent_at in self.sent.values() if value > 0]
+        return min(running) + self.params.keepalive_interval if running else None
+
+    def next_retry(self) -> Optional[float]:
+        """When failed commands are due to be sent again, or None if every actuator has its last command."""
+        if not self.unconfirmed:
+            return None
+        return min(self.unconfirmed.values()) + self.params.device_retry_interval
+
+    @staticmethod
+    def quantize(strength: float, step_count: Optional[int]) -> float:
+        """Round a strength to the nearest step the actuator can actually produce."""
+        if not step_count:
+            return strength
+        return round(min(1.0, max(0.0, strength)) * step_count) / step_count
+
+    async def _send_device(self, device, commands: list) -> None:
+        """Send one device its actuator values, as a single ScalarCmd where the actuators support it."""
+        # ScalarCmd (protocol v3) actuators have a type, older ones only take their own command
+        scalars = [
+            v3.Scalar(actuator.index, value, actuator.type) for actuator, value in commands if hasattr(actuator, "type")
+        ]
+        if scalars:
+            message = await device.send(v3.ScalarCmd(device.index, scalars))
+            if isinstance(message, v3.Error):
+                raise message.error_code.exception(message.error_message)
+        for actuator, value in commands:
+            if not hasattr(actuator, "type"):
+                await actuator.command(value)
+
+    async def _dispatch(self, device_index: int, device, commands: list, now: float) -> None:
+        """Send a device its commands within device_timeout, without letting a failure affect the other devices."""
+        sent_at = self.latency.now() if self.latency is not None else 0.0
+        device_timeout = self.params.device_timeout
+        try:
+            await asyncio.wait_for(self._send_device(device, commands), timeout=device_timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Device {device.name} did not respond within {device_timeout}s")
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.warning(f"Failed to send to device {device.name}: {e!r}")
+        else:
+            if self.latency is not None:
+                self.latency.since("send_to_ack", sent_at)
+            for actuator, value in commands:
+                self.sent[(device_index, actuator.index)] = (value, now)
+                self.unconfirmed.pop((device_index, actuator.index), None)
+            return
+        # the device may or may not have applied the command, resend it after device_retry_interval (see next_retry)
+        for actuator, _ in commands:
+            self.sent.pop((device_index, actuator.index), None)
+            self.unconfirmed[(device_index, actuator.index)] = now
+
+    def forget_removed(self, devices) -> None:
+        """Forget what was sent to disconnected devices, so they get the current strength if they come back."""
+        self.sent = {key: value for key, value in self.sent.items() if key[0] in devices}
+        self.unconfirmed = {key: value for key, value in self.unconfirmed.items() if key[0] in devices}
+
+    async def output(self, devices, vibe_strength: float, now: float) -> None:
+        """Send a strength to the actuators of `devices` whose output would change."""
+        # work out what each device's actuators need to be sent
+        dispatches = []
+        keepalive_interval = self.params.keepalive_interval
+        for device_index, device in devices.items():
+            commands = []
+            for actuator in device.actuators:
+                value = self.quantize(vibe_strength, getattr(actuator, "step_count", None))
+                last = self.sent.get((device_index, actuator.index))
+                if last is not None and last[0] == value:
+                    if value == 0 or keepalive_interval <= 0 or now - last[1] < keepalive_interval:
+                        continue
+                commands.append((actuator, value))
+            if commands:
+                dispatches.append(self._dispatch(device_index, device, commands, now))
+
+        # (detected at, applied at) of the event that led here, if it is being traced
+        detected_at, applied_at = self.trace or (None, None)
+        self.trace = None
+        if applied_at is not None and dispatches:
+            self.latency.since("apply_to_send", applied_at)
+
+        # all devices at once, so the loop waits for the slowest device rather than all of them in turn
+        if dispatches:
+            await asyncio.gather(*dispatches)
+            if detected_at is not None:
+                self.latency.since("detect_to_ack", detected_at)
+
     # Takes a list of devices and activates devices based on vibration handling
     async def run_buzz(self, devices):
-        """Update the vibration strength and run the command on all devices."""
+        """Update the vibration strength and send it to the actuators whose output would change."""
         vibe_strength = self.update()
-
-        # activate all actuators
-        for device in devices.values():
-            for actuator in device.actuators:
-                await actuator.command(vibe_strength)
-        #
-        # could also do this
-        # await devices[0].actuators[0].command(vibe_strength)
-        # await devices[0].actuators[1].command(vibe_strength * 0.5)
-        # etc.
+        self.forget_removed(devices)
+        await self.output(devices, vibe_strength, self.clock())